@@ -1,12 +1,15 @@
 from __future__ import division
 import sys
-from blokus import BlokusApp
+from blokus.blokus_game import BlokusApp
+from blokus import instrument
 
 if __name__ == '__main__':
 
     screen_mode  = 'all_players'
     player_types = ['ai'] * 4
     show_all     = True
+    turns        = None
+    profile      = None
 
     arguments = sys.argv
     while len(arguments) > 1:
@@ -20,8 +23,17 @@ if __name__ == '__main__':
         if argument == 'show_all':
             value = ((arguments.pop(0)).lower() == 'true')
             show_all = value
+        if argument == 'turns':
+            turns = arguments.pop(0)
+        if argument == 'profile':
+            profile = arguments.pop(0)
+
+    if turns is not None or profile is not None:
+        instrument.enable(output=turns, profile=profile)
 
     BlokusApp(screen_mode=screen_mode,
               player_types=player_types,
               show_all=show_all,
-              ).run()
\ No newline at end of file
+              ).run()
+
+    instrument.disable()
\ No newline at end of file
@@ -1 +1,3 @@
-from blokus_game import BlokusApp
\ No newline at end of file
+from game import Game
+from piece import Piece
+from player import Player
\ No newline at end of file
@@ -0,0 +1,312 @@
+"""
+benchmark the hot paths of the engine and the AI on a fixed corpus of
+early, mid and late game positions.
+
+usage:
+python -m blokus.benchmark
+python -m blokus.benchmark --save baseline.json
+python -m blokus.benchmark --baseline baseline.json
+
+every case is run several times on every position of the corpus, and
+the number of calls per second and the percentiles of the time per call
+are reported. With --baseline, the mean time per call of every case is
+compared with a saved run, and cases that became slower than the
+threshold are flagged as regressions (the exit status is then 1).
+
+the corpus in benchmark_positions.json is made from seeded random games
+with --make-corpus, and should only be remade when the rules change,
+since the timings of different corpora can not be compared.
+"""
+from __future__ import division
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from blokus.game import Game
+from blokus.game_methods import find_corners, find_available_moves
+from blokus.game_methods import determine_available_point_change
+from blokus.piece import Piece
+from blokus.player import Player, TRANSPOSITIONS
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'benchmark_positions.json')
+
+# the number of moves played before each position of the corpus is taken
+STAGES = [('early', 9), ('mid', 34), ('late', 55)]
+
+STRATEGIES = ['random', 'markov rule', 'third', 'dual rule',
+              'anytime', 'mcts']
+
+
+def make_corpus(seeds=(0, 1, 2), dimension=20):
+    """
+    play a seeded random game for every seed, and record the first
+    position after the number of moves of each stage in which the player
+    to move has a legal move.
+
+    returns a list of positions that can be written out as json.
+    """
+    positions = []
+    for seed in seeds:
+        np.random.seed(seed)
+        game = Game(dimension=dimension)
+        players = [Player(i, player_type='ai', strategy='random')
+                   for i in xrange(game.num_players)]
+        stages = list(STAGES)
+        skipped = 0
+        while stages and skipped < game.num_players:
+            if not game.has_legal_move():
+                game.increment_turn()
+                skipped += 1
+                continue
+            skipped = 0
+            # only record positions in which the player to move can move
+            if len(game.history) >= stages[0][1]:
+                positions += [{'name': stages[0][0] + '-' + str(seed),
+                               'dimension': game.dimension,
+                               'num_players': game.num_players,
+                               'round': game.round,
+                               'current_playerID': game.current_playerID,
+                               'history': [dict(move, position=list(
+                                   move['position']))
+                                   for move in game.history]}]
+                stages.pop(0)
+            move = players[game.current_playerID].make_move(game, None)
+            game.apply_move(move)
+    return positions
+
+
+def load_position(position):
+    """
+    rebuild the Game object of a position from the corpus
+    """
+    game = Game(dimension=position['dimension'],
+                num_players=position['num_players'],
+                start_points=position.get('start_points'))
+    for move in position['history']:
+        game.set_current_player(move['playerID'])
+        piece = Piece(move['pieceID'], move['playerID'],
+                      rotation=move['rotation'], parity=move['parity'])
+        problem = game.place_piece(piece, tuple(move['position']))
+        if problem != '':
+            raise RuntimeError('invalid move in the corpus: ' + problem)
+    game.set_current_player(position['current_playerID'])
+    game.round = position['round']
+    return game
+
+
+def load_corpus(path=CORPUS):
+    with open(path) as handle:
+        positions = json.load(handle)
+    return [(position['name'], load_position(position))
+            for position in positions]
+
+
+def _new_version(game):
+    # forget the placement planes that the game caches for the
+    # current position, so that every call does the full work.
+    game._version += 1
+
+
+def _moves_and_data(game):
+    moves = find_available_moves(game, None)
+    return moves, determine_available_point_change(moves, game, None)
+
+
+def get_cases():
+    """
+    the benchmark cases as a list of (name, prepare) pairs. prepare is
+    called once for every position with the game, and returns the function
+    to time and a function to call before every timed call (or None).
+    """
+    def check_if_is_allowed(game):
+        move = find_available_moves(game, None, num=1)[0]
+        piece = Piece(move['pieceID'], move['playerID'],
+                      rotation=move['rotation'], parity=move['parity'])
+        return (lambda: game.check_if_is_allowed(piece, move['position']),
+                None)
+
+    def corners(game):
+        return (lambda: find_corners(game.board, game.current_playerID,
+                                     game.round, game.start_points()),
+                None)
+
+    def available_moves(game):
+        return (lambda: find_available_moves(game, None),
+                lambda: _new_version(game))
+
+    def point_change(game):
+        moves = find_available_moves(game, None)
+        return (lambda: determine_available_point_change(moves, game, None),
+                None)
+
+    def rule(number):
+        def prepare(game):
+            moves, data = _moves_and_data(game)
+            method = getattr(Player(game.current_playerID),
+                             'rule_' + str(number))
+            return lambda: method(moves, game, None, data), None
+        return prepare
+
+    def make_move(strategy):
+        def prepare(game):
+            player = Player(game.current_playerID, player_type='ai',
+                            strategy=strategy, time_budget=100,
+                            rollouts=16)
+
+            def reset():
+                TRANSPOSITIONS.clear()
+                _new_version(game)
+                np.random.seed(0)
+            return lambda: player.make_move(game, None), reset
+        return prepare
+
+    cases = [('check_if_is_allowed', check_if_is_allowed),
+             ('find_corners', corners),
+             ('find_available_moves', available_moves),
+             ('determine_available_point_change', point_change)]
+    cases += [('rule_' + str(number), rule(number))
+              for number in xrange(1, 7)]
+    cases += [('make_move ' + strategy, make_move(strategy))
+              for strategy in STRATEGIES]
+    return cases
+
+
+def time_case(prepare, positions, repeat=5):
+    """
+    time the function of a case repeat times on every position, after
+    one call that is not timed.
+
+    returns the list of the times of every call in seconds.
+    """
+    times = []
+    stdout = sys.stdout
+    # the AI strategies print their move metrics
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for name, game in positions:
+            function, reset = prepare(game)
+            for k in xrange(repeat + 1):
+                if reset is not None:
+                    reset()
+                start = time.time()
+                function()
+                if k > 0:
+                    times += [time.time() - start]
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return times
+
+
+def summarize(times):
+    times = np.array(times)
+    return {'calls': len(times),
+            'ops_per_sec': len(times) / max(np.sum(times), 1e-12),
+            'mean': float(np.mean(times)),
+            'p50': float(np.percentile(times, 50)),
+            'p95': float(np.percentile(times, 95)),
+            'max': float(np.max(times))}
+
+
+def run(positions, repeat=5, names=None):
+    """
+    run every case (or only the cases whose name contains one of names)
+    and return a dictionary from case name to the summary of its timings.
+    """
+    results = {}
+    for name, prepare in get_cases():
+        if names and not any(part in name for part in names):
+            continue
+        results[name] = summarize(time_case(prepare, positions, repeat))
+        print format_result(name, results[name])
+        sys.stdout.flush()
+    return results
+
+
+def format_result(name, result, baseline=None, threshold=.2):
+    line = ('%-34s %10.1f ops/sec   mean %8.3f ms   p50 %8.3f ms   '
+            'p95 %8.3f ms' % (name, result['ops_per_sec'],
+                              1000 * result['mean'], 1000 * result['p50'],
+                              1000 * result['p95']))
+    if baseline is not None and name in baseline:
+        ratio = result['mean'] / baseline[name]['mean']
+        line += '   x%.2f' % ratio
+        if ratio > 1 + threshold:
+            line += '   REGRESSION'
+    return line
+
+
+def compare(results, baseline, threshold=.2):
+    """
+    the names of the cases whose mean time per call is more than
+    threshold (as a fraction) slower than in the baseline.
+    """
+    return sorted(name for name in results if name in baseline and
+                  results[name]['mean'] >
+                  (1 + threshold) * baseline[name]['mean'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='benchmark the Blokus engine and AI.')
+    parser.add_argument('--corpus', default=CORPUS,
+                        help='json file with the positions to use')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timed calls per position')
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='only run the cases whose name contains one '
+                             'of these strings')
+    parser.add_argument('--save', default=None,
+                        help='write the results to this json file')
+    parser.add_argument('--baseline', default=None,
+                        help='json file of a saved run to compare with')
+    parser.add_argument('--threshold', type=float, default=.2,
+                        help='slowdown that is flagged as a regression')
+    parser.add_argument('--make-corpus', action='store_true',
+                        help='make a new corpus and write it to --corpus')
+    args = parser.parse_args(argv)
+
+    if args.make_corpus:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            positions = make_corpus()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        with open(args.corpus, 'w') as handle:
+            handle.write('[\n' + ',\n'.join(json.dumps(p, sort_keys=True)
+                                             for p in positions) + '\n]\n')
+        print 'wrote', len(positions), 'positions to', args.corpus
+        return 0
+
+    positions = load_corpus(args.corpus)
+    results = run(positions, repeat=args.repeat, names=args.cases)
+
+    if args.save is not None:
+        with open(args.save, 'w') as handle:
+            json.dump(results, handle, indent=1, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        print
+        print 'compared with', args.baseline
+        for name in sorted(results):
+            print format_result(name, results[name], baseline, args.threshold)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print
+            print 'regressions:', ', '.join(regressions)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
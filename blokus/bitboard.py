@@ -0,0 +1,118 @@
+class BitBoard(object):
+    """
+    This object stores the blokus board as one integer bitmask per player,
+    together with a combined occupancy mask. Cell (i, j) of the board is
+    stored in bit i * stride + j, where stride = dimension + 1. The extra
+    column in each row is always empty, so that shifting a mask by one
+    column can never wrap a cell around onto the neighbouring row.
+
+    methods:
+    cell_mask: bitmask with a single board cell set.
+    piece_mask: given a piece geometry and a position, return the bitmask
+        of the cells covered by the piece.
+    edge_neighbours: cells sharing an edge with any cell in a mask.
+    corner_neighbours: cells sharing a corner with any cell in a mask.
+    place: add a mask of cells to a players set of cells.
+    remove: remove a mask of cells from a players set of cells.
+    """
+
+    def __init__(self, dimension=20, num_players=4):
+        self.dimension = int(dimension)
+        self.num_players = num_players
+        self.stride = self.dimension + 1
+
+        row = (1 << self.dimension) - 1
+        self.valid = 0
+        for i in xrange(self.dimension):
+            self.valid |= row << (i * self.stride)
+
+        self.players = [0] * num_players
+        self.occupied = 0
+        # the cells that a player may not cover because of edge contact,
+        # and the cells that make a corner contact with that player.
+        self.edges = [0] * num_players
+        self.corners = [0] * num_players
+
+    def __repr__(self):
+        string = ''
+        for i in xrange(self.dimension):
+            for j in xrange(self.dimension):
+                bit = self.cell_mask(i, j)
+                value = 0
+                for playerID in xrange(self.num_players):
+                    if self.players[playerID] & bit:
+                        value = playerID + 1
+                string += (str(value) + ' ')
+            string += '\n'
+        return string
+
+    def copy(self):
+        new = BitBoard.__new__(BitBoard)
+        new.dimension = self.dimension
+        new.num_players = self.num_players
+        new.stride = self.stride
+        new.valid = self.valid
+        new.players = list(self.players)
+        new.occupied = self.occupied
+        new.edges = list(self.edges)
+        new.corners = list(self.corners)
+        return new
+
+    def cell_mask(self, i, j):
+        return 1 << (i * self.stride + j)
+
+    def piece_mask(self, geometry, position):
+        """
+        return the bitmask of the cells covered by a piece with the
+        given geometry placed at position, or -1 if the piece is not
+        completely on the board.
+        """
+        size = geometry.shape
+        if (position[0] < 0 or position[1] < 0 or
+                position[0] + size[0] > self.dimension or
+                position[1] + size[1] > self.dimension):
+            return -1
+        base = _base_mask(geometry, self.stride)
+        return base << (position[0] * self.stride + position[1])
+
+    def edge_neighbours(self, mask):
+        stride = self.stride
+        return ((mask << 1) | (mask >> 1) |
+                (mask << stride) | (mask >> stride)) & self.valid
+
+    def corner_neighbours(self, mask):
+        stride = self.stride
+        return ((mask << (stride + 1)) | (mask << (stride - 1)) |
+                (mask >> (stride + 1)) | (mask >> (stride - 1))) & self.valid
+
+    def place(self, playerID, mask):
+        self.players[playerID] |= mask
+        self.occupied |= mask
+        self._update_neighbours(playerID)
+
+    def remove(self, playerID, mask):
+        self.players[playerID] &= ~mask
+        self.occupied &= ~mask
+        self._update_neighbours(playerID)
+
+    def _update_neighbours(self, playerID):
+        self.edges[playerID] = self.edge_neighbours(self.players[playerID])
+        self.corners[playerID] = self.corner_neighbours(self.players[playerID])
+
+
+# cache of piece masks anchored at the origin, keyed on the board stride
+# and the geometry of the piece.
+_BASE_MASKS = {}
+
+
+def _base_mask(geometry, stride):
+    key = (stride, geometry.shape, geometry.tobytes())
+    mask = _BASE_MASKS.get(key)
+    if mask is None:
+        mask = 0
+        for i in xrange(geometry.shape[0]):
+            for j in xrange(geometry.shape[1]):
+                if geometry[i, j] == 1:
+                    mask |= 1 << (i * stride + j)
+        _BASE_MASKS[key] = mask
+    return mask
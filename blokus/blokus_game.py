@@ -18,8 +18,10 @@ from game import Game
 from player import Player
 from initial_positions import InitialPositions
 from settings import Settings
+from worker import MoveWorker
+import instrument
+import mcts
 from piece import Piece
-from game_methods import find_corners, find_available_moves
 
 
 class BlokusApp(App):
@@ -39,6 +41,10 @@ class BlokusApp(App):
         can be overwritten by keyword argument inputs here
         """
         self.settings = Settings(**kwargs)
+        # the trays of pieces around the board are laid out for the
+        # classic board, so other board sizes are only for the engine.
+        if self.settings.board_size != 20:
+            raise ValueError('the display only supports a 20x20 board')
         super(BlokusApp, self).__init__(*args, **kwargs)
         return
 
@@ -49,8 +55,14 @@ class BlokusApp(App):
         """
         game = BlokusGame(self.settings)
         Clock.schedule_interval(game.update, self.settings.frame_rate)
+        self.game = game
         return game
 
+    def on_stop(self):
+        # discard any AI move that is still being computed.
+        self.game.cancel_move()
+        mcts.close_pools()
+
 
 class BlokusGame(Widget):
     """
@@ -106,7 +118,8 @@ class BlokusGame(Widget):
         with self.canvas:
             # create a game board
             self.game = Game(dimension=self.settings.board_size, 
-                             num_players=self.settings.num_players)
+                             num_players=self.settings.num_players,
+                             start_points=self.settings.start_points)
 
             # initialize a list of helper widgets (stars that indicate
             # where you can place a piece that appear if you attempt to
@@ -142,10 +155,20 @@ class BlokusGame(Widget):
                 self.players += [Player(i,
                                   player_type=self.settings.player_types[i],
                                   strategy=self.settings.player_strategies[i],
-                                  weights=self.settings.player_weights[i])]
-
-            # initialize the current attempted move.
+                                  weights=self.settings.player_weights[i],
+                                  opening_book=self.settings.opening_book,
+                                  endgame=self.settings.endgame)]
+            # the players that search with a pool of processes get it
+            # now, since it can not be forked from the thread of the
+            # move worker.
+            for player in self.players:
+                if player.strategy == 'mcts' and player.processes > 1:
+                    mcts.get_pool(player.processes)
+
+            # initialize the current attempted move, and the background
+            # worker that computes the moves of the AI players.
             self.current_move = [-1, []]
+            self.move_worker = None
 
             # these are the initial positions for all of the pieces.
             # these locations are outside of the board and are fairly optimally
@@ -296,7 +319,10 @@ class BlokusGame(Widget):
         update the gameboard given that the time between the last update
         and now has been dt.
         """
+        with instrument.timer('frame'):
+            self.update_frame(dt)
 
+    def update_frame(self, dt):
         # move the menu above the active piece so that it stays in sync with
         # the active piece
         if self.active_piece >= 0:
@@ -379,9 +405,19 @@ class BlokusGame(Widget):
                 player = self.players[self.game.current_playerID]
                 if player.player_type != 'human':
                     if self.current_move[0] == -1:
-                        move = player.make_move(self.game, self.pieces)
+                        # the AI computes its move in the background, so
+                        # that the display keeps updating while it thinks.
+                        if self.move_worker is None:
+                            self.move_worker = MoveWorker(player, self.game)
+                            return
+                        if not self.move_worker.done():
+                            return
+                        move = dict(self.move_worker.get())
+                        self.move_worker = None
                         position = move['position']
-                        ind = move['index']
+                        ind = self.find_piece_index(move['playerID'],
+                                                    move['pieceID'])
+                        move['index'] = ind
                         print move
                         if self.pieces[
                                 ind].playerID != self.game.current_playerID:
@@ -405,6 +441,26 @@ class BlokusGame(Widget):
                         self.add_piece()
                         self.current_move = [-1, []]
 
+    def find_piece_index(self, playerID, pieceID):
+        """
+        find the index in self.pieces of the piece widget with the given
+        playerID and pieceID, or -1 if that piece has been placed.
+        """
+        for i in xrange(len(self.pieces)):
+            if (self.pieces[i].playerID == playerID and
+                    self.pieces[i].piece.pieceID == pieceID):
+                return i
+        return -1
+
+    def cancel_move(self):
+        """
+        discard the move that an AI player is computing in the background,
+        for example when the game is reset or closed.
+        """
+        if self.move_worker is not None:
+            self.move_worker.cancel()
+            self.move_worker = None
+
     def flip_active_piece(self, *l):
         # flip the active piece vertically
         self.pieces[self.active_piece].flip()
@@ -488,8 +544,7 @@ class BlokusGame(Widget):
             counter = 0
             while counter < 4:
                 # check to see if any moves are possible
-                moves = find_available_moves(self.game, self.pieces, num=1)
-                if len(moves) == 0:
+                if not self.game.has_legal_move():
                     print 'skipping a turn'
                     self.game.increment_turn()
                     counter += 1
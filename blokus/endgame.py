@@ -0,0 +1,138 @@
+"""
+an exact solver for the end of the game.
+
+late in the game every player has only a few pieces and corners left, so
+all of the ways in which a player can still place pieces can be searched.
+The solver finds the sequence of moves that places the most squares for
+one player, assuming that the other players do not move any more (they
+usually have few moves left, and the moves of different players rarely
+interact this late in the game).
+
+the search is a depth first search over the moves of the player, with
+every position that has been solved stored in a transposition table
+under its zobrist hash, since the same set of pieces placed in a
+different order gives the same position. Moves are tried from the
+largest piece to the smallest, and a branch is cut when the squares
+that could still be placed in it can not beat the best found so far.
+"""
+import numpy as np
+
+from game_methods import find_available_moves
+from piece import PIECE_SIZES, ORIENTATION_SIZES
+from transposition import TranspositionTable
+
+
+class _NodeLimit(Exception):
+    """
+    raised inside the search when it has visited too many positions.
+    """
+    pass
+
+
+def upper_bound(game, playerID):
+    """
+    the most squares that playerID could still place: the area of the
+    remaining pieces, or the number of free cells that can be reached
+    from the corners of the player, whichever is smaller. The pieces of
+    a player always connect through corners, so every cell that can
+    still be covered is in the region of free cells (not touching an
+    edge of the player) connected to the corners of the player through
+    edges or corners.
+    """
+    area = sum(PIECE_SIZES[pieceID] for pieceID in game.remaining[playerID])
+    bits = game.bitboard
+    free = bits.valid & ~bits.occupied & ~bits.edges[playerID]
+    region = 0
+    for i, j in game.corners[playerID]:
+        region |= bits.cell_mask(i, j)
+    region &= free
+    while True:
+        grown = (region | bits.edge_neighbours(region) |
+                 bits.corner_neighbours(region)) & free
+        if grown == region:
+            break
+        region = grown
+    return min(area, bin(region).count('1'))
+
+
+class EndgameSolver(object):
+    """
+    This object searches the remaining moves of a player exactly, to find
+    the move that leads to the most squares placed by the end of the game.
+    The solved positions are kept between calls.
+
+    methods:
+    solve: the best move of a player and the number of squares that the
+        player can still place.
+    """
+
+    def __init__(self, node_limit=5000, capacity=100000):
+        """
+        inputs:
+        node_limit: (int) the number of positions that a call to solve may
+            visit, after which it gives up.
+        capacity: (int) size of the table of solved positions.
+        """
+        self.node_limit = node_limit
+        self.table = TranspositionTable(capacity=capacity)
+        self.nodes = 0
+
+    def solve(self, game, playerID=-1):
+        """
+        find the best move of playerID (by default the current player) in
+        the current position of game, which is left unchanged.
+
+        returns (squares, move), where squares is the most squares that
+        the player can still place and move is the first move to get
+        there (None if the player can not move), or None if the search
+        visited more than node_limit positions.
+        """
+        if playerID < 0:
+            playerID = game.current_playerID
+        current = game.current_playerID
+        game.set_current_player(playerID)
+        self.nodes = 0
+        try:
+            return self._search(game, playerID)
+        except _NodeLimit:
+            return None
+        finally:
+            game.set_current_player(current)
+
+    def _value(self, game, playerID):
+        value = self.table.get(game.hash)
+        if value is None:
+            value = self._search(game, playerID)[0]
+            self.table.put(game.hash, value)
+        return value
+
+    def _search(self, game, playerID):
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise _NodeLimit()
+
+        bound = upper_bound(game, playerID)
+        if bound == 0:
+            return 0, None
+        moves = find_available_moves(game, None, playerID=playerID)
+        if len(moves) == 0:
+            return 0, None
+
+        best, best_move = 0, None
+        sizes = ORIENTATION_SIZES[moves.orientations]
+        for k in np.argsort(-sizes, kind='mergesort'):
+            size = int(sizes[k])
+            move = moves[k]
+            game.apply_move(move, trusted=True)
+            game.set_current_player(playerID)
+            try:
+                if size + upper_bound(game, playerID) > best:
+                    value = size + self._value(game, playerID)
+                    if value > best:
+                        best, best_move = value, move
+            finally:
+                game.undo_move()
+            if best >= bound:
+                # every square that could be placed has been placed
+                break
+        return best, best_move
@@ -1,7 +1,35 @@
 import numpy as np
-import copy
 
-from game_methods import find_corners
+from bitboard import BitBoard
+from zobrist import get_keys, start_key
+from piece import Piece, PIECES, PIECE_SIZES, PIECE_ORIENTATIONS
+from piece import ORIENTATION_CELLS, MAX_PIECE_SIZE
+
+EDGES = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+DIAGONALS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+# width of the border around the planes used for vectorized placement
+# checks, wide enough that no block of a piece touching the board can
+# land outside of them.
+PAD = MAX_PIECE_SIZE
+
+# the board size, number of players and start cells of the variants of
+# the game. The start points of None are the corners of the board.
+VARIANTS = {'classic': {'dimension': 20, 'num_players': 4,
+                        'start_points': None},
+            'duo': {'dimension': 14, 'num_players': 2,
+                    'start_points': [(4, 4), (9, 9)]}}
+
+
+def corner_start_points(dimension):
+    """
+    the corners of the board, in the order in which the players start
+    on them.
+    """
+    return [(0, 0),
+            (0, dimension - 1),
+            (dimension - 1, dimension - 1),
+            (dimension - 1, 0)]
+
 
 class Game(object):
     """
@@ -9,22 +37,83 @@ class Game(object):
 
 	methods:
 	increment_turn: increments the playerID, and the round counter.
-	find_available_corners: for the specified playerID, find corners
+	set_current_player: change whose turn it is, keeping the hash up to date.
+	find_available_corners: for the specified playerID, return the corners
 		that represent valid connection points for a piece.
+	check_placements: vectorized legality check for many candidate moves.
+	find_candidates: every placement of some pieces that covers a corner.
+	find_placements: every allowed placement of some pieces.
+	has_legal_move: determine whether a player can make any move.
+	placement_planes: the padded boolean planes behind check_placements.
+	update_corners: update the corners of every player around a piece
+		that has just been placed.
 	check_if_is_allowed: given a piece and a piece position on the board
 		determine if the move is allowed or not. This function contains
 		most of the rules of Blokus
+	check_placement: the rules behind check_if_is_allowed, evaluated
+		with bitwise operations on the bitboard without building a board.
 	place_piece: given a piece and a valid position, place the piece
 		on the current game board, and increment the turn.
+	apply_move: place the piece described by a move dictionary.
+	undo_move: take back the last move that was placed.
+	snapshot: a copy of the game, without the information to undo moves.
     """
 
-    def __init__(self, dimension=20, num_players=4):
+    def __init__(self, dimension=20, num_players=4, start_points=None):
+        """
+        inputs:
+        dimension: (int) size of the board.
+        num_players: (int 2-4) number of players.
+        start_points: (list of (i, j) cells or None) the cell that the
+            first piece of each player has to cover, by default the
+            corners of the board.
+        """
+        if start_points is None:
+            start_points = corner_start_points(dimension)[:num_players]
+        start_points = [tuple(int(x) for x in point)
+                        for point in start_points]
+        if not 2 <= num_players <= 4:
+            raise ValueError('a game has 2 to 4 players')
+        # the longest piece is a line of MAX_PIECE_SIZE blocks
+        if dimension < MAX_PIECE_SIZE:
+            raise ValueError('the board should be at least ' +
+                             str(MAX_PIECE_SIZE) + ' cells wide')
+        if len(start_points) != num_players:
+            raise ValueError('there should be a start point for every player')
+        if len(set(start_points)) != len(start_points):
+            raise ValueError('every player should have a different start point')
+        for point in start_points:
+            if not (0 <= point[0] < dimension and 0 <= point[1] < dimension):
+                raise ValueError('the start point ' + str(point) +
+                                 ' is not on the board')
         self.board = np.zeros([dimension, dimension])
         self.round = 0
         self.num_players = num_players
         self.current_playerID = 0
         self.dimension = int(dimension)
         self.history = []
+        self.bitboard = BitBoard(dimension=dimension, num_players=num_players)
+        # the valid connection corners for each player, kept up to date
+        # as pieces are placed.
+        self._start_points = start_points
+        self.corners = [set([point]) for point in start_points]
+        # the pieceIDs that each player has not placed yet.
+        self.remaining = [set(PIECES.keys()) for i in xrange(num_players)]
+        # a 64 bit zobrist hash of the position, updated as the
+        # game progresses.
+        self.hash = self.zobrist.turn[0]
+        # the start points are part of the position, but the corners of
+        # the board add nothing, which keeps the hashes of the classic
+        # game (and the opening books made from them) unchanged.
+        if start_points != corner_start_points(dimension)[:num_players]:
+            self.hash ^= start_key(start_points)
+        # the information needed to undo each move in the history
+        self._undo = []
+        # counts every change to the board, to know when cached
+        # planes are out of date.
+        self._version = 0
+        self._planes_key = None
+        self._planes = None
 
     def __repr__(self):
         string = ''
@@ -34,128 +123,350 @@ class Game(object):
             string += '\n'
         return string
 
+    @property
+    def zobrist(self):
+        # the keys are shared between games, so they are not stored on
+        # the game (which keeps copies of the game cheap).
+        return get_keys(self.dimension, self.num_players)
+
     def increment_turn(self):
         if self.current_playerID == self.num_players - 1:
-            self.current_playerID = 0
+            self.set_current_player(0)
             self.round = self.round + 1
         else:
-            self.current_playerID = self.current_playerID + 1
+            self.set_current_player(self.current_playerID + 1)
+
+    def set_current_player(self, playerID):
+        self.hash ^= (self.zobrist.turn[self.current_playerID] ^
+                      self.zobrist.turn[playerID])
+        self.current_playerID = playerID
 
     def find_available_corners(self, playerID=-1):
         if playerID < 0:
             playerID = self.current_playerID
-        Available_Corners = find_corners(self.board, playerID, self.round)
-        return Available_Corners
+        # this is the live set of corners, so it should not be modified.
+        return self.corners[playerID]
 
     def check_if_is_allowed(self, piece, piece_position):
-
-        start_points = [[0, 0], [0, self.dimension -
-                                 1], [self.dimension -
-                                      1, self.dimension -
-                                      1], [self.dimension -
-                                           1, 0]]
-        corners = [[-1, -1], [-1, 1], [1, -1], [1, 1]]
-        edges = [[1, 0], [-1, 0], [0, 1], [0, -1]]
-        new_board = copy.deepcopy(self.board)
-
-        if self.current_playerID == piece.playerID:
-            playerID = self.current_playerID
-            corner_touch = 0
-
-            geo = piece.geometry
-            Size = geo.shape
-
-            problem = ''  # if there is a problem, it will show up here
-            # problem indicates if a move violates a rule of the game,
-            # and if so indicates why
-
-            for i in xrange(Size[0]):
-                for j in xrange(Size[1]):
-                    if geo[i, j] == 1 and problem == '':
-                        # the positioin of one of the blocks is at X:
-                        X = [piece_position[0] + i, piece_position[1] + j]
-                        # check that this is on the board:
-                        InRange = (
-                            ((X[0] < self.dimension) and (
-                                X[0] >= 0)) and (
-                                (X[1] < self.dimension) and (
-                                    X[1] >= 0)))
-                        if InRange:
-                            # check that this location is not occupied:
-                            if new_board[X[0], X[1]] == 0:
-                                new_board[X[0], X[1]] = -1
-                                if self.round == 0:
-                                    if X == start_points[playerID]:
-                                        corner_touch = 1
-                                else:
-                                    # check that it is touching at least 1
-                                    # corner:
-                                    CornerTouch = []
-                                    for corner in corners:
-                                        pos = (
-                                            X[0] + corner[0], X[1] + corner[1])
-                                        if (pos[0] in xrange(0, self.dimension)) and (
-                                                pos[1] in xrange(0, self.dimension)):
-                                            CornerTouch += [
-                                                (new_board[pos[0], pos[1]] == playerID + 1)]
-                                    if np.any(CornerTouch):
-                                        corner_touch = 1
-
-                                    EdgeTouch = []
-                                    for edge in edges:
-                                        pos = (X[0] + edge[0], X[1] + edge[1])
-                                        if (pos[0] in xrange(0, self.dimension)) and (
-                                                pos[1] in xrange(0, self.dimension)):
-                                            touch = (
-                                                new_board[
-                                                    pos[0], pos[1]] == playerID + 1)
-                                            EdgeTouch += [touch]
-                                            if touch:
-                                                problem = 'this piece has a shared edge with another piece'
-                                                break
-                                    if np.any(EdgeTouch):
-                                        problem = 'this piece has a shared edge with another piece'
-                            else:
-                                problem = 'this piece overlaps with an existing piece'
-                        else:
-                            problem = 'the piece is not completely on the board'
-
-                    if problem != '':
-                        break
-                if problem != '':
-                    break
-
-            if corner_touch == 0 and problem == '':
-                if self.round == 0:
-                    problem = 'the piece must touch the right corner of the board'
-                else:
-                    problem = 'the piece must be adjacent to a piece of the same color'
-
-            if problem == '':
-                # the piece has been placed successfully, place it on the board,
-                # increment the turn, and make a log of the turn
-                new_board[new_board == -1] = playerID + 1
-            else:
-                new_board[new_board == -1] = 0
+        """
+        determine whether placing piece at piece_position is allowed.
+        returns the board that would result from the move, and a string
+        describing the problem with the move (empty if the move is allowed).
+        if the move is not allowed, the current board is returned unchanged.
+        """
+        problem, mask = self.check_placement(piece, piece_position)
+        if problem == '':
+            new_board = self.board.copy()
+            self._fill_board(new_board, piece, piece_position)
         else:
+            new_board = self.board
+        return new_board, problem
+
+    def check_placement(self, piece, piece_position):
+        """
+        apply the rules of Blokus to a piece placement using the
+        bitboards. returns a string describing the problem with the
+        move (empty if the move is allowed) and the bitmask of the cells
+        that are covered by the piece.
+        """
+        if self.current_playerID != piece.playerID:
             problem = ('you cant place a piece it is player ' +
                        str(self.current_playerID + 1) + 's turn.')
-            # print problem
-        return new_board, problem
+            return problem, 0
+
+        playerID = self.current_playerID
+        bits = self.bitboard
+        mask = bits.piece_mask(piece.geometry, piece_position)
+
+        if mask < 0:
+            return 'the piece is not completely on the board', 0
+        if mask & bits.occupied:
+            return 'this piece overlaps with an existing piece', mask
+
+        # the first piece of each player has to cover their start point.
+        # this is the same as checking for the first round, but it also
+        # holds when moves are applied out of turn (see apply_move).
+        if bits.players[playerID] == 0:
+            start = self.start_points()[playerID]
+            if not (mask & bits.cell_mask(start[0], start[1])):
+                return 'the piece must cover the start point of the player', mask
+        else:
+            if mask & bits.edges[playerID]:
+                return 'this piece has a shared edge with another piece', mask
+            if not (mask & bits.corners[playerID]):
+                return 'the piece must be adjacent to a piece of the same color', mask
+
+        return '', mask
+
+    def update_corners(self, piece, position):
+        """
+        after a piece has been placed, update the sets of valid
+        connection corners using only the cells in and around the
+        footprint of the piece. returns the cells of the footprint.
+        """
+        playerID = piece.playerID
+        bits = self.bitboard
+        footprint = [(int(position[0] + i), int(position[1] + j))
+                     for i, j in piece.cells]
+
+        # a covered cell is no longer a corner for anybody
+        for corners in self.corners:
+            corners.difference_update(footprint)
+
+        own = self.corners[playerID]
+        for cell in footprint:
+            for edge in EDGES:
+                own.discard((cell[0] + edge[0], cell[1] + edge[1]))
+            for corner in DIAGONALS:
+                pos = (cell[0] + corner[0], cell[1] + corner[1])
+                if (0 <= pos[0] < self.dimension and
+                        0 <= pos[1] < self.dimension):
+                    bit = bits.cell_mask(pos[0], pos[1])
+                    if not (bit & bits.occupied or bit & bits.edges[playerID]):
+                        own.add(pos)
+        return footprint
+
+    def check_placements(self, orientations, positions, playerID=-1):
+        """
+        vectorized version of check_placement for many candidate moves
+        of the same player at once.
+
+        inputs:
+        orientations: (int array of length n) indices into piece.ORIENTATIONS
+        positions: (int array n x 2) the board position of each candidate
+        playerID: (int) the player making the moves, by default the
+            current player.
+
+        returns a boolean array of length n, True where the move is allowed.
+        """
+        if playerID < 0:
+            playerID = self.current_playerID
+        blocked, anchors = self.placement_planes(playerID)
+
+        orientations = np.asarray(orientations, dtype=int)
+        positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+        cells = ORIENTATION_CELLS[orientations]
+        limit = blocked.shape[0] - 1
+        # every position that falls outside of the padded planes is
+        # moved onto the blocked border of the planes.
+        rows = np.clip(positions[:, 0, None] + cells[:, :, 0] + PAD, 0, limit)
+        cols = np.clip(positions[:, 1, None] + cells[:, :, 1] + PAD, 0, limit)
+
+        allowed = ~np.any(blocked[rows, cols], axis=1)
+        allowed &= np.any(anchors[rows, cols], axis=1)
+        return allowed
+
+    def find_candidates(self, pieceIDs, playerID=-1):
+        """
+        every placement of the given pieces that covers at least one of
+        the corners of the player, without duplicates. These still have
+        to be checked with check_placements.
+
+        returns an array of orientation indices and an (n x 2) array
+        of positions.
+        """
+        if playerID < 0:
+            playerID = self.current_playerID
+        orientations = np.array([index for pieceID in pieceIDs
+                                 for index in PIECE_ORIENTATIONS[pieceID]],
+                                dtype=int)
+        corners = self.corners[playerID]
+        if len(orientations) == 0 or len(corners) == 0:
+            return orientations[:0], np.zeros([0, 2], dtype=int)
+
+        # place every block of every orientation on every corner.
+        anchors = np.array(sorted(corners))
+        cells = ORIENTATION_CELLS[orientations]
+        positions = anchors[None, None, :, :] - cells[:, :, None, :]
+        number = positions.shape[1] * positions.shape[2]
+        candidates = np.repeat(orientations, number)
+        positions = positions.reshape(-1, 2)
+
+        # the same placement can be reached from more than one corner and
+        # more than one block of the piece, so only keep it once.
+        span = self.dimension + 2 * PAD
+        keys = ((candidates * span + positions[:, 0] + PAD) * span +
+                positions[:, 1] + PAD)
+        keys, first = np.unique(keys, return_index=True)
+        first = np.sort(first)
+        return candidates[first], positions[first]
+
+    def find_placements(self, pieceIDs, playerID=-1):
+        """
+        every allowed placement of the given pieces for the player,
+        as an array of orientation indices and an (n x 2) array of positions.
+        """
+        if playerID < 0:
+            playerID = self.current_playerID
+        orientations, positions = self.find_candidates(pieceIDs, playerID)
+        if len(orientations) == 0:
+            return orientations, positions
+        allowed = self.check_placements(orientations, positions, playerID)
+        return orientations[allowed], positions[allowed]
+
+    def has_legal_move(self, playerID=-1):
+        """
+        determine whether the player can place any of their remaining
+        pieces. The smallest pieces are the most likely to fit, so they
+        are tried first, and the search stops at the first allowed move.
+        """
+        if playerID < 0:
+            playerID = self.current_playerID
+        if len(self.corners[playerID]) == 0:
+            return False
+        for pieceID in sorted(self.remaining[playerID],
+                              key=lambda pieceID: PIECE_SIZES[pieceID]):
+            # the monomino fits on any corner
+            if PIECE_SIZES[pieceID] == 1:
+                return True
+            orientations, positions = self.find_placements([pieceID], playerID)
+            if len(orientations) > 0:
+                return True
+        return False
+
+    def placement_planes(self, playerID):
+        """
+        the boolean planes used by check_placements, padded by PAD cells
+        on every side: blocked marks cells that no block of the players
+        piece may cover (off the board, occupied, or sharing an edge with
+        the players own pieces), and anchors marks the players corners,
+        at least one of which must be covered.
+        """
+        key = (playerID, self._version)
+        if self._planes_key == key:
+            return self._planes
+
+        size = self.dimension + 2 * PAD
+        inner = slice(PAD, PAD + self.dimension)
+        own = np.zeros([size, size], dtype=bool)
+        own[inner, inner] = (self.board == playerID + 1)
+
+        blocked = np.ones([size, size], dtype=bool)
+        blocked[inner, inner] = (self.board != 0)
+        blocked[1:, :] |= own[:-1, :]
+        blocked[:-1, :] |= own[1:, :]
+        blocked[:, 1:] |= own[:, :-1]
+        blocked[:, :-1] |= own[:, 1:]
+
+        anchors = np.zeros([size, size], dtype=bool)
+        for corner in self.corners[playerID]:
+            anchors[corner[0] + PAD, corner[1] + PAD] = True
+
+        self._planes_key = key
+        self._planes = (blocked, anchors)
+        return self._planes
+
+    def start_points(self):
+        """
+        the cell that the first piece of each player has to cover
+        """
+        return list(self._start_points)
+
+    def _fill_board(self, board, piece, position):
+        geo = piece.geometry
+        Size = geo.shape
+        region = board[position[0]:position[0] + Size[0],
+                       position[1]:position[1] + Size[1]]
+        region[geo == 1] = piece.playerID + 1
 
     def place_piece(self, piece, position):
 
-        new_board, problem = self.check_if_is_allowed(piece, position)
+        problem, mask = self.check_placement(piece, position)
 
         if problem == '':
             # if the piece has been placed successfully, place it on the board,
             # increment the turn, and make a log of the turn.
-            self.history += [{'playerID': piece.playerID,
-                              'pieceID': piece.pieceID,
-                              'rotation': piece.rotation,
-                              'parity': piece.parity,
-                              'position': position}]
-            self.board = new_board
+            self._commit(piece, position, mask)
+
+        return problem
+
+    def apply_move(self, move, trusted=False):
+        """
+        make a move, given as a dictionary like the ones returned by
+        find_available_moves, on this game. If it is not yet the turn of
+        the player making the move, the players in between are skipped.
+        The move can be taken back with undo_move.
+
+        if trusted is True, the move is known to be allowed (for example
+        because it is replayed from a finished game), and the rules are
+        not checked.
+
+        returns a string describing the problem with the move (empty if
+        the move is allowed), in which case the game is left unchanged.
+        """
+        state = (self.current_playerID, self.round, self.hash)
+        for i in xrange(self.num_players):
+            if self.current_playerID == move['playerID']:
+                break
             self.increment_turn()
 
-        return problem
\ No newline at end of file
+        piece = Piece(move['pieceID'], move['playerID'],
+                      rotation=move['rotation'], parity=move['parity'])
+        if trusted:
+            problem = ''
+            mask = self.bitboard.piece_mask(piece.geometry, move['position'])
+        else:
+            problem, mask = self.check_placement(piece, move['position'])
+        if problem == '':
+            self._commit(piece, move['position'], mask, state=state)
+        else:
+            self.current_playerID, self.round, self.hash = state
+        return problem
+
+    def undo_move(self):
+        """
+        take back the last move in the history, restoring the game to
+        the state it was in before the move (including whose turn it was).
+        """
+        move = self.history.pop()
+        state, mask, footprint, corners = self._undo.pop()
+        self.current_playerID, self.round, self.hash = state
+        self.corners = corners
+        self.bitboard.remove(move['playerID'], mask)
+        self.remaining[move['playerID']].add(move['pieceID'])
+        for i, j in footprint:
+            self.board[i, j] = 0
+        self._version += 1
+        return move
+
+    def snapshot(self):
+        """
+        a copy of the game in its current position. The copy does not
+        hold the information needed to undo the moves made so far, which
+        makes it much cheaper than a deep copy late in the game.
+        """
+        game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game.board = self.board.copy()
+        game.history = list(self.history)
+        game.bitboard = self.bitboard.copy()
+        game.corners = [set(c) for c in self.corners]
+        game.remaining = [set(r) for r in self.remaining]
+        game._undo = []
+        game._planes_key = None
+        game._planes = None
+        return game
+
+    def _commit(self, piece, position, mask, state=None):
+        """
+        place an allowed piece on the board, log it in the history,
+        and increment the turn.
+        """
+        if state is None:
+            state = (self.current_playerID, self.round, self.hash)
+        corners = [set(c) for c in self.corners]
+
+        self.history += [{'playerID': piece.playerID,
+                          'pieceID': piece.pieceID,
+                          'rotation': piece.rotation,
+                          'parity': piece.parity,
+                          'position': position}]
+        self._fill_board(self.board, piece, position)
+        self.bitboard.place(piece.playerID, mask)
+        self.remaining[piece.playerID].discard(piece.pieceID)
+        footprint = self.update_corners(piece, position)
+        self.hash ^= self.zobrist.placement(piece.playerID, piece.pieceID,
+                                            footprint)
+        self._undo += [(state, mask, footprint, corners)]
+        self._version += 1
+        self.increment_turn()
\ No newline at end of file
@@ -1,54 +1,67 @@
-from piece import Piece
+from piece import ORIENTATION_INDEX
+from piece import ORIENTATION_CELLS, ORIENTATION_SHAPES, ORIENTATION_SIZES
+from piece import MAX_PIECE_SIZE
+from game import corner_start_points
+from moves import MoveList
+from instrument import timer
 
 import numpy as np
-import copy
+import itertools
 
-def find_corners(board, playerID, game_round):
+# the patterns used by the heuristic rules, in a board where the cells of
+# the player are -1, the cells of opponents are -2 and empty cells are 0.
+# a bridge is a gap between two opponent pieces that the player can cross:
+BRIDGE_PATTERNS = [[[0, -2], [-2, -1]], [[-2, 0], [-1, -2]],
+                   [[-2, -1], [0, -2]], [[-1, -2], [-2, 0]]]
+# and an edge is shared between a piece of the player and an opponent:
+EDGE_PATTERNS = [[[-1, -2]], [[-1], [-2]], [[-2, -1]], [[-2], [-1]]]
+
+
+def find_corners(board, playerID, game_round, start_points=None):
     """
     given an input board, and given a player_id, and game_round index,
     determine all of the corners that are valid connection points.
 
     inputs:
     board: (square numpy array) array containing the current pieces on the game board
-    playerID: (int 0-3) id corresponding to each of the 4 players
+    playerID: (int 0-3) id corresponding to each of the players
     game_round: (int) number counting the current round in the game.
+    start_points: (list of (i, j) cells or None) the start cell of each
+        player, by default the corners of the board (see Game).
     """
     dimension = board.shape[0]
-    start_points = [[0, 0], 
-                    [0, dimension - 1],
-                    [dimension - 1, dimension - 1], 
-                    [dimension - 1, 0]]
+    if start_points is None:
+        start_points = corner_start_points(dimension)
     corners = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
     edges = [(1, 0), (-1, 0), (0, 1), (0, -1)]
     if game_round == 0:
-        available_corners = [start_points[playerID]]
+        available_corners = [list(start_points[playerID])]
     else:
         available_corners = []
-        for i in xrange(dimension):
-            for j in xrange(dimension):
-                if board[i, j] == playerID + 1:
-                    for corner in corners:
-                        pos = (i + corner[0], j + corner[1])
-                        if ((pos[0] in range(0, dimension)) and 
-                            (pos[1] in range(0, dimension))):
-                            available = True
-                            if board[pos[0], pos[1]] == 0:
-                                for edge in edges:
-                                    pos2 = (pos[0] + edge[0], pos[1] + edge[1])
-                                    if (pos2[0] in xrange(0, dimension)) and (
-                                            pos2[1] in xrange(0, dimension)):
-                                        if board[
-                                                pos2[0], pos2[1]] == playerID + 1:
-                                            available = False
-                                            break
-                            else:
-                                available = False
-
-                        else:
-                            available = False
-
-                        if available:
-                            available_corners += [pos]
+        # only the cells of the player can have corners next to them
+        for i, j in np.argwhere(board == playerID + 1).tolist():
+            for corner in corners:
+                pos = (i + corner[0], j + corner[1])
+                if (0 <= pos[0] < dimension and
+                        0 <= pos[1] < dimension):
+                    available = True
+                    if board[pos[0], pos[1]] == 0:
+                        for edge in edges:
+                            pos2 = (pos[0] + edge[0], pos[1] + edge[1])
+                            if (0 <= pos2[0] < dimension and
+                                    0 <= pos2[1] < dimension):
+                                if board[
+                                        pos2[0], pos2[1]] == playerID + 1:
+                                    available = False
+                                    break
+                    else:
+                        available = False
+
+                else:
+                    available = False
+
+                if available:
+                    available_corners += [pos]
     return available_corners
 
 def find_available_moves(game, pieces, playerID=-1, num=-1):
@@ -58,174 +71,330 @@ def find_available_moves(game, pieces, playerID=-1, num=-1):
     want to default to playerID=game.current_playerID), then determine which
     moves are possible.
 
+    if pieces is None, the pieces that have not been placed yet are taken
+    from game.remaining, and the 'index' of every move is -1.
+
     num indicates how many moves to find. In principle, we only need to find
     one in order to indicate if the game can continue normally.
+
+    returns a MoveList, which can be used like a list of move dictionaries.
+    """
+    if playerID < 0:
+        playerID = game.current_playerID
+
+    if num > 0:
+        moves = MoveList(num)
+        moves.extend(itertools.islice(
+            iter_available_moves(game, pieces, playerID=playerID), num))
+        return moves
+
+    # when every move is needed, test all of the pieces in a single batch.
+    pieces = _player_pieces(game, pieces, playerID)
+    orientations, positions = game.find_placements(
+        [pieceID for ind, pieceID in pieces], playerID=playerID)
+    return MoveList.from_placements(playerID, pieces, orientations, positions)
+
+
+def iter_available_moves(game, pieces, playerID=-1):
+    """
+    generate the available moves one at a time, with the same inputs
+    as find_available_moves. The pieces are tested one at a time, so
+    if the caller stops early, the remaining pieces are never tested.
     """
     if playerID < 0:
         playerID = game.current_playerID
 
-    corners = game.find_available_corners(playerID=playerID)
-
-    # here are all of the available mating corners for each playerID
-    #(i could get away with only the corners for the current player, but
-    # getting all of them allows me to just how many blokus's are performed on a move
-    # which could be part of a goodness metric for a strategy).
-
-    # remove all of the other players pieces from the list
-    pieces = [[i, pieces[i].piece]
-              for i in xrange(len(pieces)) if pieces[i].playerID == playerID]
-    moves = []
-
-    for item in pieces:
-        for rotation in xrange(0, 4):
-            for parity in [-1, 1]:
-                piece = item[1]
-                ind = item[0]
-                test_piece = Piece(
-                    piece.pieceID,
-                    piece.playerID,
-                    rotation=rotation,
-                    parity=parity)
-                geo = test_piece.geometry
-                Size = geo.shape
-                for i in xrange(Size[0]):
-                    for j in xrange(Size[1]):
-                        for corner in corners:
-                            test_position = (corner[0] - i, corner[1] - j)
-                            new_board, problem = game.check_if_is_allowed(
-                                test_piece, test_position)
-                            if problem == '':
-                                moves = moves + [{'playerID': piece.playerID,
-                                                  'index': ind,
-                                                  'pieceID': piece.pieceID,
-                                                  'position': test_position,
-                                                  'rotation': rotation,
-                                                  'parity': parity}]
-                            if (num > 0 and len(moves) >= num):
-                                break
-                        if (num > 0 and len(moves) >= num):
-                            break
-                    if (num > 0 and len(moves) >= num):
-                        break
-                if (num > 0 and len(moves) >= num):
-                    break
-            if (num > 0 and len(moves) >= num):
-                break
-        if (num > 0 and len(moves) >= num):
-            break
-
-    return moves
+    for item in _player_pieces(game, pieces, playerID):
+        orientations, positions = game.find_placements(
+            [item[1]], playerID=playerID)
+        for move in _build_moves(playerID, [item], orientations, positions):
+            yield move
+
+
+def _player_pieces(game, pieces, playerID):
+    """
+    list the (index, pieceID) of every piece that belongs to playerID
+    """
+    if pieces is None:
+        return [[-1, pieceID] for pieceID in sorted(game.remaining[playerID])]
+    return [[i, pieces[i].piece.pieceID]
+            for i in xrange(len(pieces)) if pieces[i].playerID == playerID]
+
+
+def _build_moves(playerID, pieces, orientations, positions):
+    """
+    turn arrays of orientations and positions into move dictionaries
+    """
+    return iter(MoveList.from_placements(playerID, pieces,
+                                         orientations, positions))
+
+# the window around a move in which the corners can change, which is the
+# bounding box of the piece with a border of two cells: the corners of the
+# piece are one cell away, and their edge neighbours one cell further.
+_DELTA_WINDOW = MAX_PIECE_SIZE + 4
+
 
 def determine_available_point_change(moves, game, pieces):
     """
     this is a function that is necessary for heuristic AI 
     rules 2 and 4 which rely on corner point expansion 
     or blocking of available corners.
+
+    placing a piece can only change the corners in and around its
+    footprint, so for every move only a small window of the board around
+    the piece is looked at, and all of the moves are handled at once.
+
+    returns a dictionary with two arrays, with one entry for each move:
+    'add native': the change in the number of corners of the player.
+    'block opposition': the number of opponent corners covered by the piece.
     """
+    orientations, positions = move_arrays(moves)
+    if len(orientations) == 0:
+        empty = np.zeros(0, dtype=int)
+        return {'add native': empty, 'block opposition': empty}
+    playerID = moves[0]['playerID']
+
+    # planes of the board: occupied cells, own cells, own corners and the
+    # number of opponents with a corner on each cell. the border outside
+    # of the board counts as occupied.
+    pad = _DELTA_WINDOW
+    span = game.dimension + 2 * pad
+    inner = slice(pad, pad + game.dimension)
+    planes = np.zeros([4, span, span], dtype=np.int8)
+    planes[0] = 1
+    planes[0, inner, inner] = game.board > 0
+    planes[1, inner, inner] = game.board == playerID + 1
+    for ID, corners in enumerate(game.corners):
+        for corner in corners:
+            channel = 2 if ID == playerID else 3
+            planes[channel, corner[0] + pad, corner[1] + pad] += 1
 
-    # find the corners in the starting point:
-    corners = []
-    number_c = []
-    for i in xrange(4):
-        corner = game.find_available_corners(playerID=i)
-        corners += [corner]
-        number_c += [len(corner)]
-
-    NativeCorners = [tuple(corn) for corn in corners[moves[0]['playerID']]]
-    OppositionCorners = [corners[i] for i in xrange(
-        len(corners)) if i != moves[0]['playerID']]
-    OppositionCorners = [tuple(item)
-                         for sublist in corners for item in sublist]
-
-    blokus = []
-    expansion = []
-    for move in moves:
-        native_corners = copy.deepcopy(NativeCorners)
-        opposition_corners = copy.deepcopy(OppositionCorners)
-
-        test_board = copy.deepcopy(game.board)  # np.zeros(game.board.shape)
-        test_piece = Piece(
-            move['pieceID'],
-            move['playerID'],
-            rotation=move['rotation'],
-            parity=move['parity'])
-        geo = test_piece.geometry
-        Size = geo.shape
-        position = move['position']
-        for i in xrange(Size[0]):
-            for j in xrange(Size[1]):
-                if geo[i, j] == 1:
-                    test_position = (position[0] + i, position[1] + j)
-                    test_board[
-                        test_position[0],
-                        test_position[1]] = (
-                        move['playerID'] + 1)
-                    if test_position in native_corners:
-                        ind = native_corners.index(test_position)
-                        native_corners.pop(ind)
-                    if test_position in opposition_corners:
-                        ind = opposition_corners.index(test_position)
-                        opposition_corners.pop(ind)
-
-        new_corners = find_corners(
-            test_board,
-            game.current_playerID,
-            game.round + 1)
-
-        new_corners = [tuple(corn) for corn in new_corners]
-        for corner in new_corners:
-            if not(corner in native_corners):
-                native_corners.append(corner)
-
-        # print len(native_corners)
-        blokus += [len(OppositionCorners) - len(opposition_corners)]
-        expansion += [len(native_corners) - len(NativeCorners)]
-
-    return {'add native': expansion, 'block opposition': blokus}
+    # gather the window of every move, starting two cells above and to
+    # the left of its position.
+    offsets = np.arange(_DELTA_WINDOW)
+    rows = positions[:, 0, None] - 2 + pad + offsets
+    cols = positions[:, 1, None] - 2 + pad + offsets
+    windows = planes[:, rows[:, :, None], cols[:, None, :]]
+    occupied, own, native = windows[:3].astype(bool)
+    opposition = windows[3]
+
+    footprint = np.zeros(own.shape, dtype=bool)
+    cells = ORIENTATION_CELLS[orientations] + 2
+    index = np.arange(len(orientations))[:, None]
+    footprint[index, cells[:, :, 0], cells[:, :, 1]] = True
+
+    blocked = np.sum(opposition * footprint, axis=(1, 2))
+
+    # after the move, a cell is a corner if it is empty, has no edge
+    # contact with the player, and was either a corner before or touches
+    # the corner of the new piece.
+    own |= footprint
+    occupied |= footprint
+    edges = np.zeros(own.shape, dtype=bool)
+    edges[:, 1:, :] |= own[:, :-1, :]
+    edges[:, :-1, :] |= own[:, 1:, :]
+    edges[:, :, 1:] |= own[:, :, :-1]
+    edges[:, :, :-1] |= own[:, :, 1:]
+    diagonals = np.zeros(own.shape, dtype=bool)
+    diagonals[:, 1:, 1:] |= footprint[:, :-1, :-1]
+    diagonals[:, 1:, :-1] |= footprint[:, :-1, 1:]
+    diagonals[:, :-1, 1:] |= footprint[:, 1:, :-1]
+    diagonals[:, :-1, :-1] |= footprint[:, 1:, 1:]
+    new_native = (native | diagonals) & ~occupied & ~edges
+
+    # only compare the cells whose neighbours are all inside the window
+    area = (slice(None), slice(1, -1), slice(1, -1))
+    expansion = (np.sum(new_native[area], axis=(1, 2)) -
+                 np.sum(native[area], axis=(1, 2)))
+
+    return {'add native': expansion, 'block opposition': blocked}
+
+
+def move_arrays(moves):
+    """
+    the orientation indices (array of length n) and the positions
+    (n x 2 array) of a list of moves.
+    """
+    if isinstance(moves, MoveList):
+        return (moves.orientations.astype(int),
+                moves.positions.astype(int))
+    orientations = np.array(
+        [move['orientation'] if 'orientation' in move else
+         ORIENTATION_INDEX[(move['pieceID'], move['rotation'] % 4,
+                            move['parity'])]
+         for move in moves], dtype=int)
+    positions = np.array([move['position'] for move in moves],
+                         dtype=int).reshape(-1, 2)
+    return orientations, positions
+
+
+def move_features(moves, game, data):
+    """
+    compute the values of the six heuristic AI rules for every move in
+    one vectorized pass. data is the output of
+    determine_available_point_change for the same moves.
+
+    returns an (n_moves x 6) array, with one column per rule:
+    1. the number of blocks in the piece
+    2. the change in the number of own corners
+    3. the distance from the walls
+    4. the number of opponent corners that are blocked
+    5. the number of edges shared with opponents after the move
+    6. the number of bridges in the area of the move, before plus after
+    """
+    orientations, positions = move_arrays(moves)
+    features = np.zeros([len(orientations), 6])
+    if len(orientations) == 0:
+        return features
+    playerID = game.current_playerID
+    # the board is encoded once for the pattern rules 5 and 6
+    encoded = encode_board(game.board, playerID)
+    with timer('rule_1'):
+        features[:, 0] = ORIENTATION_SIZES[orientations]
+    with timer('rule_2'):
+        features[:, 1] = data['add native']
+    with timer('rule_3'):
+        features[:, 2] = find_centrality(game, orientations, positions)
+    with timer('rule_4'):
+        features[:, 3] = data['block opposition']
+    with timer('rule_5'):
+        features[:, 4] = count_move_patterns(game, playerID, orientations,
+                                             positions, EDGE_PATTERNS,
+                                             encoded=encoded)
+    with timer('rule_6'):
+        features[:, 5] = (count_move_patterns(game, playerID, orientations,
+                                              positions, BRIDGE_PATTERNS,
+                                              place=False, encoded=encoded) +
+                          count_move_patterns(game, playerID, orientations,
+                                              positions, BRIDGE_PATTERNS,
+                                              encoded=encoded))
+    return features
+
+
+def find_centrality(game, orientations, positions):
+    """
+    for each move, the distance between the center of the piece and
+    the closest wall, measured as half the board size minus the distance
+    between the center of the piece and the center of the board.
+    """
+    half_dim = np.floor(game.dimension / 2.)
+    center = positions + ORIENTATION_SHAPES[orientations] / 2.
+    dist = np.sqrt(np.sum((center - half_dim) ** 2, axis=1))
+    return half_dim - dist
+
+
+# the window around a move in which patterns are counted, which is the
+# bounding box of the piece with a border of one cell.
+_WINDOW = MAX_PIECE_SIZE + 2
+# value given to cells that are outside of the board or the window of a
+# move, which does not match any pattern.
+_OUTSIDE = 1
+
+
+def encode_board(board, playerID, pad=0):
+    """
+    encode a board for pattern counting, with -1 for the cells of playerID,
+    -2 for the cells of opponents and 0 for empty cells, surrounded by a
+    border of pad cells that are outside of the board. The input board is
+    not changed.
+    """
+    shape = (board.shape[0] + 2 * pad, board.shape[1] + 2 * pad)
+    encoded = np.full(shape, _OUTSIDE, dtype=np.int8)
+    encoded[pad:pad + board.shape[0], pad:pad + board.shape[1]] = \
+        np.where(board == playerID + 1, -1, np.where(board > 0, -2, 0))
+    return encoded
+
+
+def board_windows(encoded, origins, sizes, shape):
+    """
+    gather many windows from an encoded board in one step.
+
+    inputs:
+    encoded: (2d numpy array) board from encode_board.
+    origins: (n x 2 array) top left cell of each window, which may be
+        outside of the board.
+    sizes: (n x 2 array) size of each window, which is at most shape.
+    shape: (tuple) size of the returned windows.
+
+    returns an (n x shape[0] x shape[1]) array, in which the cells that are
+    outside of the board or beyond the size of their window are _OUTSIDE.
+    """
+    rows = origins[:, 0, None] + np.arange(shape[0])
+    cols = origins[:, 1, None] + np.arange(shape[1])
+    outside = ((rows < 0) | (rows >= encoded.shape[0]) |
+               (np.arange(shape[0]) >= sizes[:, 0, None]))[:, :, None] | \
+              ((cols < 0) | (cols >= encoded.shape[1]) |
+               (np.arange(shape[1]) >= sizes[:, 1, None]))[:, None, :]
+    rows = np.clip(rows, 0, encoded.shape[0] - 1)
+    cols = np.clip(cols, 0, encoded.shape[1] - 1)
+    windows = encoded[rows[:, :, None], cols[:, None, :]]
+    windows[outside] = _OUTSIDE
+    return windows
+
+
+def count_patterns(windows, patterns):
+    """
+    count the instances of patterns that lie completely inside each of a
+    stack of encoded windows (n x height x width), by comparing shifted
+    views of the windows with every cell of a pattern.
+
+    returns an array with the number of instances in each window.
+    """
+    height, width = windows.shape[-2:]
+    counts = np.zeros(windows.shape[:-2], dtype=int)
+    for pattern in patterns:
+        pattern = np.asarray(pattern)
+        rows = height - pattern.shape[0] + 1
+        cols = width - pattern.shape[1] + 1
+        if rows <= 0 or cols <= 0:
+            continue
+        match = windows[..., :rows, :cols] == pattern[0, 0]
+        for k in xrange(pattern.shape[0]):
+            for m in xrange(pattern.shape[1]):
+                if k > 0 or m > 0:
+                    match &= (windows[..., k:k + rows, m:m + cols] ==
+                              pattern[k, m])
+        counts += np.sum(match, axis=(-2, -1))
+    return counts
+
+
+def count_move_patterns(game, playerID, orientations, positions,
+                        patterns, place=True, encoded=None):
+    """
+    count the instances of patterns in the window around each move, which
+    is the bounding box of the piece with a border of one cell. If place
+    is True, the piece of the move is counted as a cell of playerID.
+    encoded is the board of game from encode_board for playerID, which
+    is encoded here if it is not given.
+
+    returns an array with the number of instances for each move.
+    """
+    if encoded is None:
+        encoded = encode_board(game.board, playerID)
+    windows = board_windows(encoded, positions - 1,
+                            ORIENTATION_SHAPES[orientations] + 2,
+                            (_WINDOW, _WINDOW))
+    if place:
+        cells = ORIENTATION_CELLS[orientations] + 1
+        moves = np.arange(len(orientations))[:, None]
+        windows[moves, cells[:, :, 0], cells[:, :, 1]] = -1
+    return count_patterns(windows, patterns)
 
 
 def find_number_of_patterns(board, playerID, patterns, position=-1, size=-1):
-    board_size = board.shape
-    if position < 0 or size < 0:
-        size = board_size
+    """
+    count the instances of patterns on a board, from the point of view of
+    playerID. If a position and size are given, only the patterns in that
+    region, with a border of one cell around it, are counted.
+    """
+    if np.ndim(position) == 0 or np.ndim(size) == 0:
         position = (0, 0)
         size = board.shape
-
-    position = (position[0] - 1, position[1] - 1)
-    size = (size[0] + 2, size[1] + 2)
-
-    # first convert the board so that there are only empty spaces [0], player spaces [-1],
-    # and opposition spaces [-2]
-    board[board == (playerID + 1)] = -1
-    board[board > 0] = -2
-    # look for instances of these patterns (which are all the same but rotated
-    # and flipped)
-    cases = patterns
-    instances = 0
-    for case in cases:
-        ncase = np.array(case)
-        case_size = ncase.shape
-        for i in xrange(size[0] - case_size[0] + 1):
-            for j in xrange(size[1] - case_size[1] + 1):
-                match = True
-                for k in xrange(case_size[0]):
-                    for m in xrange(case_size[1]):
-                        temp_pos = (position[0] + i + k, position[1] + j + m)
-                        # check that the temp_pos is in the right range:
-                        if temp_pos[0] >= 0 and temp_pos[0] < board_size[0]\
-                           and temp_pos[1] >= 1 and temp_pos[1] < board_size[1]:
-                            # check if there is a match:
-                            if board[temp_pos[0], temp_pos[1]] != ncase[k, m]:
-                                match = False
-                                break
-                        else:
-                            match = False
-                            break
-                    if not match:
-                        break
-                if match:
-                    instances += 1
-    return instances
+    origins = np.array([position]) - 1
+    sizes = np.array([size]) + 2
+    windows = board_windows(encode_board(board, playerID), origins, sizes,
+                            tuple(sizes[0]))
+    return int(count_patterns(windows, patterns)[0])
 
 
 def find_bridge_instances(board, playerID, position=-1, size=-1):
@@ -233,10 +402,8 @@ def find_bridge_instances(board, playerID, position=-1, size=-1):
     given a board, find and count the number of instances of "bridging" - this means
     that a player of one color has an opportunity to cross the boundary of another
     """
-    patterns = [[[0, -2], [-2, -1]], [[-2, 0], [-1, -2]],
-                [[-2, -1], [0, -2]], [[-1, -2], [-2, 0]]]
     bridges = find_number_of_patterns(
-        board, playerID, patterns, position=position, size=size)
+        board, playerID, BRIDGE_PATTERNS, position=position, size=size)
     return bridges
 
 
@@ -245,11 +412,10 @@ def find_edge_sharing(board, playerID, position=-1, size=-1):
     given a board, count the number of instances of edge sharing between our
     pieces and other pieces
     """
-    patterns = [[[-1, -2]], [[-1], [-2]], [[-2, -1]], [[-2], [-1]]]
     edges = find_number_of_patterns(
         board,
         playerID,
-        patterns,
+        EDGE_PATTERNS,
         position=position,
         size=size)
     return edges
\ No newline at end of file
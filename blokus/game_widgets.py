@@ -18,7 +18,6 @@ import copy
 import numpy as np  # for array manupulation and math
 import sys
 
-from game import Game
 from piece import Piece
 
 class Block(Widget):
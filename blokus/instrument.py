@@ -0,0 +1,199 @@
+"""
+opt-in timing of the work done in every turn of the AI players.
+
+instrumentation is off by default, in which case timer() returns a shared
+object that does nothing, so the hooks in the engine cost one function
+call each. When it is enabled with
+
+    from blokus import instrument
+    instrument.enable(output='turns.jsonl', profile='turns.prof')
+
+the time spent in every timed section is added up per turn, and every
+turn is written as one line of json to the output file (and kept in
+instrument.TURNS if there is no output file). The time spent outside of
+the turns, such as in the updates of the display, is only added to the
+totals, which disable() writes to the output file as a last line of the
+form {"totals": {name: [seconds, calls]}} (the workers of a selfplay
+batch each write their own totals line). With profile, every turn
+also runs under cProfile, and the combined statistics are written to
+that file by disable().
+
+the timed sections are:
+move generation: finding the available moves.
+corner delta: determine_available_point_change.
+rule_1 ... rule_6: the heuristic rules.
+lookahead: the lookahead of the 'dual rule', 'anytime' and 'mcts'
+    strategies, which includes the rules and moves evaluated inside it.
+endgame: the exact endgame solver.
+frame: one update of the display (outside of the turns).
+"""
+import cProfile
+import json
+import threading
+import time
+
+ENABLED = False
+
+# the records of the finished turns, if they are not written to a file
+TURNS = []
+# the total time and number of calls of every section, over all turns
+# and frames: name -> [seconds, calls]
+TOTALS = {}
+
+_state = {'output': None, 'profiler': None, 'profile': None}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, time.time() - self.start)
+        return False
+
+
+def timer(name):
+    """
+    a context manager that adds the time spent inside it to the section
+    called name, or does nothing if instrumentation is disabled.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def record(name, seconds):
+    """
+    add a measured time to the section called name
+    """
+    with _lock:
+        total = TOTALS.setdefault(name, [0., 0])
+        total[0] += seconds
+        total[1] += 1
+    turn = getattr(_local, 'turn', None)
+    if turn is not None:
+        sections = turn['sections']
+        sections[name] = sections.get(name, 0.) + seconds
+
+
+def begin_turn(playerID, strategy):
+    """
+    start the record of a turn in the current thread
+    """
+    if not ENABLED:
+        return
+    _local.turn = {'playerID': playerID,
+                   'strategy': strategy,
+                   'sections': {},
+                   'start': time.time()}
+    if _state['profiler'] is not None:
+        _state['profiler'].enable()
+
+
+def annotate(**info):
+    """
+    add keyword arguments to the record of the turn in the current thread,
+    if there is one.
+    """
+    turn = getattr(_local, 'turn', None)
+    if ENABLED and turn is not None:
+        turn.update(info)
+
+
+def end_turn(**info):
+    """
+    finish the record of the turn in the current thread, and write it out.
+    any keyword arguments are added to the record.
+    """
+    turn = getattr(_local, 'turn', None)
+    _local.turn = None
+    if not ENABLED or turn is None:
+        return
+    if _state['profiler'] is not None:
+        _state['profiler'].disable()
+    turn['duration'] = time.time() - turn.pop('start')
+    turn.update(info)
+    with _lock:
+        if _state['output'] is not None:
+            _state['output'].write(json.dumps(turn) + '\n')
+            _state['output'].flush()
+        else:
+            TURNS.append(turn)
+
+
+def enable(output=None, profile=None):
+    """
+    turn instrumentation on.
+
+    inputs:
+    output: (string or None) json lines file to append the turns to.
+        If None, the turns are kept in TURNS.
+    profile: (string or None) file to write the cProfile statistics of
+        all of the turns to when instrumentation is disabled.
+    """
+    global ENABLED
+    disable()
+    if output is not None:
+        _state['output'] = open(output, 'a')
+    if profile is not None:
+        _state['profiler'] = cProfile.Profile()
+        _state['profile'] = profile
+    ENABLED = True
+
+
+def disable():
+    """
+    turn instrumentation off, closing the output file and writing out the
+    profile if there is one.
+    """
+    global ENABLED
+    ENABLED = False
+    if _state['output'] is not None:
+        with _lock:
+            totals = dict((name, list(total))
+                          for name, total in TOTALS.items())
+        _state['output'].write(json.dumps({'totals': totals}) + '\n')
+        _state['output'].close()
+    if _state['profiler'] is not None:
+        _state['profiler'].dump_stats(_state['profile'])
+    _state.update(output=None, profiler=None, profile=None)
+
+
+def reset():
+    """
+    forget the recorded turns and totals
+    """
+    with _lock:
+        del TURNS[:]
+        TOTALS.clear()
+
+
+def summary():
+    """
+    a few lines with the total and mean time of every section
+    """
+    lines = []
+    for name in sorted(TOTALS, key=lambda name: -TOTALS[name][0]):
+        seconds, calls = TOTALS[name]
+        lines += ['%-16s %9.3f s total  %6d calls  %8.3f ms mean'
+                  % (name, seconds, calls, 1000. * seconds / calls)]
+    return '\n'.join(lines)
@@ -0,0 +1,298 @@
+from __future__ import division
+
+import atexit
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from game_methods import find_available_moves
+from piece import ORIENTATIONS, PIECE_SIZES
+
+
+class Node(object):
+    """
+    This object is a node in the Monte Carlo search tree. It holds the
+    move that leads to it from its parent (None for a skipped turn),
+    the player who made that move, and the statistics of the rollouts
+    that passed through it.
+    """
+
+    def __init__(self, move=None, playerID=-1, parent=None):
+        self.move = move
+        self.playerID = playerID
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.rewards = None
+
+    def select_child(self, exploration):
+        """
+        choose the child with the highest upper confidence bound, from
+        the point of view of the player who makes the move to that child.
+        """
+        log_visits = np.log(self.visits)
+        best = None
+        best_value = -np.inf
+        for child in self.children:
+            value = (child.rewards[child.playerID] / child.visits +
+                     exploration * np.sqrt(log_visits / child.visits))
+            if value > best_value:
+                best = child
+                best_value = value
+        return best
+
+
+def move_key(move):
+    """
+    a hashable key for a move, used to combine the results of searches
+    run in different processes.
+    """
+    return (move['playerID'], move['pieceID'],
+            move['rotation'], move['parity'], tuple(move['position']))
+
+
+def get_rewards(game):
+    """
+    the result of a game for each player: 1 for the player who placed
+    the most squares, shared equally if more than one player did.
+    """
+    squares = [-sum(PIECE_SIZES[pieceID] for pieceID in remaining)
+               for remaining in game.remaining]
+    best = max(squares)
+    winners = [i for i in xrange(len(squares)) if squares[i] == best]
+    rewards = np.zeros(game.num_players)
+    rewards[winners] = 1. / len(winners)
+    return rewards
+
+
+class _Walk(object):
+    """
+    keeps track of the moves and skipped turns made on a game during one
+    iteration of the search, so that they can all be taken back.
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.actions = []
+        self.passes = 0
+
+    def move(self, move):
+        self.game.apply_move(move)
+        self.actions.append(None)
+        self.passes = 0
+
+    def skip(self):
+        game = self.game
+        self.actions.append((game.current_playerID, game.round, game.hash))
+        game.increment_turn()
+        self.passes += 1
+
+    def finished(self):
+        return self.passes >= self.game.num_players
+
+    def undo(self):
+        game = self.game
+        while self.actions:
+            state = self.actions.pop()
+            if state is None:
+                game.undo_move()
+            else:
+                game.current_playerID, game.round, game.hash = state
+
+
+def rollout(walk, random, max_moves=-1):
+    """
+    play the game to the end from the current position. Each player
+    tries their remaining pieces from the largest to the smallest (in a
+    random order for pieces of the same size), and places the first piece
+    that fits at a random allowed position.
+    """
+    game = walk.game
+    number = 0
+    while not walk.finished() and number != max_moves:
+        playerID = game.current_playerID
+        pieceIDs = sorted(game.remaining[playerID],
+                          key=lambda pieceID: (-PIECE_SIZES[pieceID],
+                                               random.rand()))
+        placed = False
+        for pieceID in pieceIDs:
+            orientations, positions = game.find_placements([pieceID])
+            if len(orientations) > 0:
+                k = random.randint(len(orientations))
+                orientation = orientations[k]
+                walk.move({'playerID': playerID,
+                           'pieceID': pieceID,
+                           'orientation': orientation,
+                           'rotation': ORIENTATIONS[orientation].rotation,
+                           'parity': ORIENTATIONS[orientation].parity,
+                           'position': (int(positions[k, 0]),
+                                        int(positions[k, 1]))})
+                placed = True
+                break
+        if not placed:
+            walk.skip()
+        number += 1
+
+
+def search(game, rollouts=-1, time_budget=-1, exploration=1.4, seed=None,
+           max_moves=-1):
+    """
+    run a Monte Carlo tree search from the current position of game, which
+    is left unchanged. The search stops after the given number of rollouts,
+    or when time_budget (in milliseconds) runs out, whichever comes first.
+
+    returns a dictionary from move_key to [move, visits, mean reward for
+    the player to move].
+    """
+    if rollouts <= 0 and time_budget <= 0:
+        rollouts = 100
+    random = np.random.RandomState(seed)
+    deadline = time.time() + time_budget / 1000. if time_budget > 0 else None
+    root = Node(playerID=-1)
+    count = 0
+    while count != rollouts:
+        if deadline is not None and time.time() > deadline and count > 0:
+            break
+        walk = _Walk(game)
+        node = root
+        try:
+            # selection: go down the tree while every move has been tried.
+            while True:
+                if node.untried is None:
+                    node.untried = _expand(game)
+                if node.untried or not node.children or walk.finished():
+                    break
+                node = node.select_child(exploration)
+                _play(walk, node.move)
+
+            # expansion: add one of the untried moves to the tree.
+            if node.untried and not walk.finished():
+                move = node.untried.pop(random.randint(len(node.untried)))
+                child = Node(move=move, playerID=game.current_playerID,
+                             parent=node)
+                node.children.append(child)
+                _play(walk, move)
+                node = child
+
+            # simulation
+            rollout(walk, random, max_moves=max_moves)
+            rewards = get_rewards(game)
+        finally:
+            walk.undo()
+
+        # backpropagation
+        while node is not None:
+            node.visits += 1
+            if node.rewards is None:
+                node.rewards = np.zeros(game.num_players)
+            node.rewards += rewards
+            node = node.parent
+        count += 1
+
+    playerID = game.current_playerID
+    return dict((move_key(child.move),
+                 [child.move, child.visits,
+                  child.rewards[playerID] / child.visits])
+                for child in root.children if child.move is not None)
+
+
+def _expand(game):
+    """
+    the moves available from the current position, with [None]
+    standing for a skipped turn if the player cannot move.
+    """
+    moves = find_available_moves(game, None)
+    if len(moves) == 0:
+        return [None]
+    return list(moves)
+
+
+def _play(walk, move):
+    if move is None:
+        walk.skip()
+    else:
+        walk.move(move)
+
+
+def _search_worker(arguments):
+    game, kwargs = arguments
+    return search(game, **kwargs)
+
+
+# the process pools of parallel_search, by number of processes
+_POOL = {}
+
+
+def get_pool(processes):
+    """
+    the process pool that parallel_search uses with this many processes.
+    The pool is forked from the current process, so it should be created
+    from the main thread (and not from the thread of a MoveWorker) before
+    the search first needs it.
+    """
+    if processes not in _POOL:
+        if not isinstance(threading.current_thread(), threading._MainThread):
+            raise RuntimeError('the pool of ' + str(processes) +
+                               ' processes should be created with get_pool '
+                               'from the main thread')
+        _POOL[processes] = multiprocessing.Pool(processes)
+    return _POOL[processes]
+
+
+def close_pools():
+    """
+    close the process pools of parallel_search and wait for their
+    processes to finish.
+    """
+    while _POOL:
+        processes, pool = _POOL.popitem()
+        pool.close()
+        pool.join()
+
+
+atexit.register(close_pools)
+
+
+def parallel_search(game, processes=None, rollouts=-1, time_budget=-1,
+                    exploration=1.4, seed=None, max_moves=-1):
+    """
+    root parallel Monte Carlo tree search: every process searches its own
+    tree from the current position, with an equal share of the rollouts
+    and the full time budget, and the visit counts of the root moves are
+    added up.
+
+    returns the move with the most visits in total.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if seed is None:
+        seed = np.random.randint(2 ** 31 - processes)
+
+    tasks = []
+    for i in xrange(processes):
+        share = -1
+        if rollouts > 0:
+            share = rollouts // processes + (i < rollouts % processes)
+        tasks.append((game, {'rollouts': share,
+                             'time_budget': time_budget,
+                             'exploration': exploration,
+                             'seed': seed + i,
+                             'max_moves': max_moves}))
+
+    if processes > 1:
+        results = get_pool(processes).map(_search_worker, tasks)
+    else:
+        results = [_search_worker(tasks[0])]
+
+    totals = {}
+    for result in results:
+        for key, (move, visits, value) in result.items():
+            if key not in totals:
+                totals[key] = [move, 0]
+            totals[key][1] += visits
+    best = max(totals.values(), key=lambda item: item[1])
+    return best[0]
+
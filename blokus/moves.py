@@ -0,0 +1,125 @@
+import numpy as np
+
+from piece import ORIENTATIONS, ORIENTATION_INDEX
+
+# the fields of a move, packed into a numpy structured array. the rotation
+# and parity of a move are not stored, since they follow from its
+# orientation.
+MOVE_DTYPE = np.dtype([('playerID', np.int8),
+                       ('index', np.int16),
+                       ('pieceID', np.int8),
+                       ('orientation', np.int16),
+                       ('position', np.int16, (2,))])
+
+_ROTATIONS = np.array([orientation.rotation for orientation in ORIENTATIONS])
+_PARITIES = np.array([orientation.parity for orientation in ORIENTATIONS])
+_PIECE_IDS = np.array([orientation.pieceID for orientation in ORIENTATIONS])
+
+
+class MoveList(object):
+    """
+    This object is a list of moves stored in a numpy structured array,
+    which takes a few bytes per move instead of a dictionary. Indexing
+    with an integer returns the move as a dictionary with the same keys
+    as before ('playerID', 'index', 'pieceID', 'orientation', 'position',
+    'rotation', 'parity'), and iterating over it gives all of the moves
+    as dictionaries, so it can be used in place of a list of moves.
+
+    methods:
+    from_placements: build a list from the arrays of orientations and
+        positions returned by Game.find_placements.
+    append: add a move at the end, growing the storage when it is full.
+    orientations, positions: the columns of the list, without copying.
+    """
+
+    def __init__(self, capacity=0):
+        self.data = np.zeros(capacity, dtype=MOVE_DTYPE)
+        self.size = 0
+
+    @classmethod
+    def from_placements(cls, playerID, pieces, orientations, positions):
+        """
+        inputs:
+        playerID: (int) the player making the moves.
+        pieces: (list) the [index, pieceID] of the pieces of the player.
+        orientations: (int array of length n) indices into piece.ORIENTATIONS
+        positions: (int array n x 2) the board position of each move
+        """
+        moves = cls(len(orientations))
+        moves.size = len(orientations)
+        if moves.size == 0:
+            return moves
+        indices = np.zeros(_PIECE_IDS.max() + 1, dtype=int)
+        for ind, pieceID in pieces:
+            indices[pieceID] = ind
+        data = moves.data
+        data['playerID'] = playerID
+        data['orientation'] = orientations
+        data['pieceID'] = _PIECE_IDS[orientations]
+        data['index'] = indices[data['pieceID']]
+        data['position'] = positions
+        return moves
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return 'MoveList(' + str(list(self)) + ')'
+
+    def __iter__(self):
+        for k in xrange(self.size):
+            yield self[k]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, np.integer)):
+            if key < 0:
+                key += self.size
+            if not 0 <= key < self.size:
+                raise IndexError('move index out of range')
+            return _as_dict(self.data[key])
+        # slices and index arrays give a new MoveList
+        moves = MoveList()
+        moves.data = self.data[:self.size][key]
+        moves.size = len(moves.data)
+        return moves
+
+    def append(self, move):
+        if self.size == len(self.data):
+            data = np.zeros(max(16, 2 * self.size), dtype=MOVE_DTYPE)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        record = self.data[self.size]
+        record['playerID'] = move['playerID']
+        record['index'] = move['index']
+        record['pieceID'] = move['pieceID']
+        if 'orientation' in move:
+            record['orientation'] = move['orientation']
+        else:
+            record['orientation'] = ORIENTATION_INDEX[
+                (move['pieceID'], move['rotation'] % 4, move['parity'])]
+        record['position'] = move['position']
+        self.size += 1
+
+    def extend(self, moves):
+        for move in moves:
+            self.append(move)
+
+    @property
+    def orientations(self):
+        return self.data['orientation'][:self.size]
+
+    @property
+    def positions(self):
+        return self.data['position'][:self.size]
+
+
+def _as_dict(record):
+    orientation = int(record['orientation'])
+    return {'playerID': int(record['playerID']),
+            'index': int(record['index']),
+            'pieceID': int(record['pieceID']),
+            'orientation': orientation,
+            'position': (int(record['position'][0]),
+                         int(record['position'][1])),
+            'rotation': int(_ROTATIONS[orientation]),
+            'parity': int(_PARITIES[orientation])}
@@ -0,0 +1,228 @@
+"""
+an opening book with the moves of the AI strategies in the first rounds
+of the game, which have the most moves to score.
+
+the book is made by playing games between AI players, and storing for
+every position in the first few rounds the move that the player to move
+would make without the random noise on its weights. It is keyed on the
+strategy, the weights and the zobrist hash of the position, so a player
+only uses the moves that were found for its own strategy and weights,
+and goes back to its normal search as soon as the game leaves the book.
+
+usage:
+python -m blokus.opening_book --games 200 --rounds 3 --output book.json
+
+and then Player(..., opening_book='book.json').
+"""
+from __future__ import division
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from blokus.game import Game, VARIANTS
+from blokus.player import Player
+from blokus.settings import Settings
+
+VERSION = 1
+
+
+class OpeningBook(object):
+    """
+    This object holds the moves of an opening book. When it is given a
+    path, the file is only read the first time that a move is looked up.
+
+    methods:
+    find_move: the book move for a player in a position, if there is one.
+    add: add the move of a strategy in a position.
+    save: write the book to a json file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = None
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        return 'OpeningBook(' + str(self.path) + ')'
+
+    def load(self):
+        if self.entries is None:
+            self.entries = {}
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path) as handle:
+                    data = json.load(handle)
+                if data['version'] != VERSION:
+                    raise IOError(self.path + ' has opening book version ' +
+                                  str(data['version']))
+                for strategy, weights, key, orientation, x, y in \
+                        data['entries']:
+                    self.entries[(strategy, tuple(weights), key)] = \
+                        (orientation, (x, y))
+        return self.entries
+
+    def add(self, strategy, weights, key, move):
+        self.load()[(strategy, _weights_key(weights), key)] = \
+            (move['orientation'], tuple(move['position']))
+
+    def find_move(self, strategy, weights, game, moves):
+        """
+        the move in moves that the book has for this strategy and these
+        weights in the position of game, or None if the position is not
+        in the book.
+        """
+        entry = self.load().get((strategy, _weights_key(weights), game.hash))
+        if entry is None:
+            return None
+        orientation, position = entry
+        for move in moves:
+            if (move['orientation'] == orientation and
+                    tuple(move['position']) == position):
+                return move
+        # a different position with the same hash
+        return None
+
+    def save(self, path=None):
+        if path is None:
+            path = self.path
+        entries = [[key[0], list(key[1]), key[2], value[0]] + list(value[1])
+                   for key, value in sorted(self.load().items())]
+        with open(path, 'w') as handle:
+            json.dump({'version': VERSION, 'entries': entries}, handle)
+
+
+def _weights_key(weights):
+    return tuple(float(w) for w in weights)
+
+
+# books that have been loaded, shared by every player that uses them
+_BOOKS = {}
+
+
+def get_book(path):
+    """
+    the OpeningBook stored in path, which is shared between all of the
+    players that use it and only loaded when it is first needed.
+    """
+    if path not in _BOOKS:
+        _BOOKS[path] = OpeningBook(path)
+    return _BOOKS[path]
+
+
+def _book_game(arguments):
+    """
+    play one game, and return the noise free moves of every player in
+    the positions of the first rounds.
+    """
+    seed, rounds, explore, settings = arguments
+    np.random.seed(seed)
+    sys.stdout = open(os.devnull, 'w')
+    players = [Player(i, player_type='ai',
+                      strategy=settings.player_strategies[i],
+                      weights=settings.player_weights[i])
+               for i in xrange(settings.num_players)]
+    # the players that find the book moves
+    exact = [Player(i, player_type='ai',
+                    strategy=settings.player_strategies[i],
+                    weights=settings.player_weights[i], noise=0)
+             for i in xrange(settings.num_players)]
+
+    game = Game(dimension=settings.board_size,
+                num_players=settings.num_players,
+                start_points=settings.start_points)
+    entries = []
+    skipped = 0
+    while game.round < rounds and skipped < game.num_players:
+        if not game.has_legal_move():
+            game.increment_turn()
+            skipped += 1
+            continue
+        skipped = 0
+        player = exact[game.current_playerID]
+        move = None
+        if player.strategy != 'random':
+            move = player.make_move(game, None)
+            entries += [(player.strategy, player.weights, game.hash, move)]
+        # players that use the book play the book moves, but sometimes the
+        # game goes on with a normal, noisy move instead, so that the book
+        # also covers the positions after other moves.
+        if move is None or np.random.rand() < explore:
+            move = players[game.current_playerID].make_move(game, None)
+        game.apply_move(move)
+    return entries
+
+
+def build_book(settings, games=100, rounds=3, processes=None, seed=0,
+               book=None, explore=.1):
+    """
+    add the moves of the first rounds of games games to an opening book.
+    explore is the fraction of the moves in which the games go on with
+    the normal move of the player instead of the book move.
+
+    returns the book.
+    """
+    if book is None:
+        book = OpeningBook()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    tasks = [(seed + i, rounds, explore, settings) for i in xrange(games)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for entries in pool.imap_unordered(_book_game, tasks):
+            for strategy, weights, key, move in entries:
+                book.add(strategy, weights, key, move)
+    finally:
+        pool.close()
+        pool.join()
+    return book
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='build an opening book for the Blokus AI.')
+    parser.add_argument('--games', type=int, default=100,
+                        help='number of games to take the positions from')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='number of rounds of every game in the book')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='size of the process pool (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--explore', type=float, default=.1,
+                        help='fraction of the moves that leave the book '
+                             'line while it is made')
+    parser.add_argument('--output', default='opening_book.json',
+                        help='json file of the book, which is added to '
+                             'if it exists')
+    parser.add_argument('--strategies', nargs='+', default=None,
+                        help='strategy of each player')
+    parser.add_argument('--weights', default=None,
+                        help='json list with the weights of each player')
+    parser.add_argument('--board-size', type=int, default=20)
+    parser.add_argument('--variant', default=None, choices=sorted(VARIANTS),
+                        help='a variant of the game, which sets the board '
+                             'size, players and start points')
+    args = parser.parse_args(argv)
+
+    weights = json.loads(args.weights) if args.weights else None
+    settings = Settings(player_strategies=args.strategies,
+                        player_weights=weights,
+                        board_size=args.board_size,
+                        variant=args.variant,
+                        headless=True)
+    book = OpeningBook(args.output)
+    size = len(book)
+    build_book(settings, games=args.games, rounds=args.rounds,
+               processes=args.processes, seed=args.seed, book=book,
+               explore=args.explore)
+    book.save()
+    print 'added', len(book) - size, 'positions, the book has', len(book)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import numpy as np
+from collections import namedtuple
 
 # here are the names of the colors in order in
 # which they will be played.
@@ -28,10 +29,115 @@ PIECES = {1: [[1]],
           21: [[1, 1, 0], [0, 1, 0], [0, 1, 1]]}
 
 
+# an orientation is one distinct geometry of a piece. rotation and parity
+# are the canonical labels of the orientation (the first label found when
+# the piece is rotated and flipped), cells are the (i, j) offsets of the
+# blocks in the piece, and shape is the size of its bounding box.
+Orientation = namedtuple('Orientation', ['index', 'pieceID', 'rotation',
+                                         'parity', 'geometry', 'cells',
+                                         'shape'])
+
+
+def _build_orientations():
+    """
+    find the unique orientations of every piece in PIECES. This is
+    done once when the module is imported.
+
+    returns:
+    orientations: list of every unique Orientation, indexed by Orientation.index
+    piece_orientations: dict from pieceID to a list of orientation indices
+    orientation_index: dict from (pieceID, rotation, parity) to an orientation index
+    """
+    orientations = []
+    piece_orientations = {}
+    orientation_index = {}
+    for pieceID in sorted(PIECES.keys()):
+        base = np.array(PIECES[pieceID])
+        found = {}
+        piece_orientations[pieceID] = []
+        for parity in [1, -1]:
+            for rotation in xrange(4):
+                geo = base
+                if parity == -1:
+                    geo = np.fliplr(geo)
+                geo = np.ascontiguousarray(np.rot90(geo, k=rotation))
+                key = (geo.shape, geo.tobytes())
+                if key not in found:
+                    geo.flags.writeable = False
+                    cells = np.argwhere(geo == 1)
+                    cells.flags.writeable = False
+                    orientation = Orientation(len(orientations), pieceID,
+                                              rotation, parity, geo,
+                                              cells, geo.shape)
+                    found[key] = orientation.index
+                    orientations.append(orientation)
+                    piece_orientations[pieceID].append(orientation.index)
+                orientation_index[(pieceID, rotation, parity)] = found[key]
+    return orientations, piece_orientations, orientation_index
+
+ORIENTATIONS, PIECE_ORIENTATIONS, ORIENTATION_INDEX = _build_orientations()
+
+# the number of blocks in each piece:
+PIECE_SIZES = dict((pieceID, int(np.sum(PIECES[pieceID])))
+                   for pieceID in PIECES)
+
+# the cells of every orientation stacked into one (orientations x 5 x 2)
+# array for vectorized placement checks. pieces with fewer than 5 blocks
+# are padded by repeating their last block, which does not change the
+# result of any all/any test over the blocks.
+MAX_PIECE_SIZE = max(PIECE_SIZES.values())
+ORIENTATION_CELLS = np.array(
+    [[orientation.cells[min(k, len(orientation.cells) - 1)]
+      for k in xrange(MAX_PIECE_SIZE)]
+     for orientation in ORIENTATIONS])
+ORIENTATION_CELLS.flags.writeable = False
+
+# the bounding box and the number of blocks of every orientation
+ORIENTATION_SHAPES = np.array([orientation.shape
+                               for orientation in ORIENTATIONS])
+ORIENTATION_SHAPES.flags.writeable = False
+ORIENTATION_SIZES = np.array([len(orientation.cells)
+                              for orientation in ORIENTATIONS])
+ORIENTATION_SIZES.flags.writeable = False
+
+
+def get_orientation(pieceID, rotation=0, parity=1):
+    """
+    look up the unique Orientation of a piece with the given rotation
+    (any integer, taken modulo 4) and parity (-1 or 1).
+    """
+    return ORIENTATIONS[ORIENTATION_INDEX[(pieceID, rotation % 4, parity)]]
+
+
+# the orientation that every orientation turns into when it is rotated
+# by k quarter turns (orientations x 4), or flipped left to right.
+ORIENTATION_ROTATIONS = np.array(
+    [[ORIENTATION_INDEX[(orientation.pieceID,
+                         (orientation.rotation + k) % 4,
+                         orientation.parity)] for k in xrange(4)]
+     for orientation in ORIENTATIONS])
+ORIENTATION_ROTATIONS.flags.writeable = False
+ORIENTATION_FLIPS = np.array(
+    [ORIENTATION_INDEX[(orientation.pieceID,
+                        (-orientation.rotation) % 4,
+                        -orientation.parity)]
+     for orientation in ORIENTATIONS])
+ORIENTATION_FLIPS.flags.writeable = False
+
+# the smallest rotation that gives an orientation with a given parity,
+# keyed on (orientation index, parity).
+_FIRST_ROTATION = {}
+for _key in sorted(ORIENTATION_INDEX, key=lambda key: key[1]):
+    _FIRST_ROTATION.setdefault((ORIENTATION_INDEX[_key], _key[2]), _key[1])
+
+
 class Piece(object):
     """
     this class defines a blokus piece - not the widget,
     but rather the information that characterizes a piece.
+    the geometry of the piece is not stored in the piece, but looked
+    up in the shared table of orientations, so rotating and flipping
+    a piece only changes its orientation index.
 
     methods:
     rotate - rotate this blokus piece
@@ -41,6 +147,8 @@ class Piece(object):
     		 place the piece on the board by setting the positions that are occupied by this
     		 piece to -1.
     """
+    __slots__ = ['pieceID', 'playerID', 'color',
+                 'rotation', 'parity', 'orientation']
 
     def __init__(self, pieceID, playerID, rotation=0, parity=1):
         """
@@ -52,64 +160,58 @@ class Piece(object):
         rotation: (int) rotation angle state between 0-3
         parity:   (int, -1 or 1) parity of the piece
         """
-
-        self._geometry = np.array(PIECES[pieceID])
-        self.geometry  = np.array(PIECES[pieceID])
-        self.rotation  = 0
-        self.parity    = 1
         self.pieceID   = pieceID
-        self.color     = COLORS[playerID]
         self.playerID  = playerID
+        self.color     = COLORS[playerID]
+        self.reset_orientation(rotation=rotation, parity=parity)
+
+    def __getstate__(self):
+        return (self.pieceID, self.playerID, self.rotation, self.parity)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
-        if parity == -1:
-            self.flip()
+    @property
+    def geometry(self):
+        return ORIENTATIONS[self.orientation].geometry
 
-        if not(rotation == 0):
-            self.rotate(rotation=rotation)
+    @property
+    def cells(self):
+        return ORIENTATIONS[self.orientation].cells
 
     def rotate(self, rotation=1):
         rotation = rotation % 4
-        self.geometry = np.rot90(self.geometry, k=rotation)
+        self.orientation = int(ORIENTATION_ROTATIONS[self.orientation, rotation])
         self.rotation = (self.rotation + rotation) % 4
 
     def flip(self):
         self.parity = (-1) * (self.parity)
-        self.geometry = np.fliplr(self.geometry)
+        self.orientation = int(ORIENTATION_FLIPS[self.orientation])
         # since the flip goes first and since the the flip operator does not
-        # commute with the rotation operator, and since this flip could come after the
-        # rotation, then I need to figure out what the right rotation value is, and
-        # set that value to self.rotation.
-        new_geo = np.array(PIECES[self.pieceID])
-        if self.parity == -1:
-            new_geo = np.fliplr(new_geo)
-        for k in xrange(4):
-            new_list = new_geo.tolist()
-            old_list = self.geometry.tolist()
-            if new_list == old_list:
-                self.rotation = k
-                break
-            else:
-                new_geo = np.rot90(new_geo, k=1)
+        # commute with the rotation operator, the rotation that gives the
+        # flipped piece has to be looked up.
+        self.rotation = _FIRST_ROTATION[(self.orientation, self.parity)]
 
     def reset_orientation(self, rotation=0, parity=1):
-        self.geometry = self._geometry
-        if parity == -1:
-            self.flip()
-        self.rotate(rotation=rotation)
+        self.rotation = rotation % 4
+        self.parity = parity
+        self.orientation = ORIENTATION_INDEX[
+            (self.pieceID, self.rotation, self.parity)]
 
     def __len__(self):
-        return np.sum(np.sum(self.geometry))
+        return PIECE_SIZES[self.pieceID]
 
     def __repr__(self):
         return (str(self.pieceID) + ':' + str(self.playerID) +
                 ':' + str(self.rotation) + ':' + str(self.parity))
 
     def shape(self):
-        return self.geometry.shape
+        return ORIENTATIONS[self.orientation].shape
 
     def place_on_board(self, board, position):
-        for i in xrange(self.geometry.shape[0]):
-            for j in xrange(self.geometry.shape[1]):
-                if self.geometry[i, j] == 1:
+        geometry = self.geometry
+        for i in xrange(geometry.shape[0]):
+            for j in xrange(geometry.shape[1]):
+                if geometry[i, j] == 1:
                     board[i, j] = -1
         return board
\ No newline at end of file
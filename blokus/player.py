@@ -1,12 +1,30 @@
 import numpy as np
-import copy
+import time
 
 from game_methods import find_available_moves
 from game_methods import determine_available_point_change
-from game_methods import find_edge_sharing
-from game_methods import find_bridge_instances
+from game_methods import move_arrays, move_features
+from game_methods import find_centrality, count_move_patterns, encode_board
+from game_methods import EDGE_PATTERNS, BRIDGE_PATTERNS
+
+from piece import PIECE_SIZES, ORIENTATION_SIZES
+from transposition import TranspositionTable
+import instrument
+from mcts import parallel_search, move_key
+from endgame import EndgameSolver
+
+# the move lists and heuristic metrics of positions that have already been
+# evaluated, shared by every player in the process so that they carry over
+# between turns and between games. move lists are stored compactly, so
+# many positions fit.
+TRANSPOSITIONS = TranspositionTable(capacity=5000)
+
+class _OutOfTime(Exception):
+    """
+    raised inside the anytime search when the time budget has run out.
+    """
+    pass
 
-from piece import Piece
 
 class Player(object):
     """
@@ -16,7 +34,10 @@ class Player(object):
     """
 
     def __init__(self, playerID, player_type='human',
-                 strategy='random', weights=[5., 1., 1, .5, 5, 10]):
+                 strategy='random', weights=[5., 1., 1, .5, 5, 10],
+                 time_budget=1000, search_width=4, rollouts=None,
+                 processes=1, noise=.2, opening_book=None, endgame=0,
+                 endgame_nodes=5000):
         """
         inputs:
 
@@ -24,10 +45,28 @@ class Player(object):
             color of the player
         player_type: (string - either 'ai' or 'human') indicates
             whether this player is controlled by a human or the computer.
-        strategy: (string - either 'random', 'markov rule', 'third'
-            or 'dual rule') specifies the type of strategy to use.
+        strategy: (string - either 'random', 'markov rule', 'third',
+            'dual rule', 'anytime' or 'mcts') specifies the type of strategy to use.
         weights: (list of length 6 of floats) specifies the linear
             weighting for each of the heuristics to use for the AI.
+        time_budget: (float) for the 'anytime' and 'mcts' strategies, the
+            time in milliseconds that the AI may spend on each move.
+        search_width: (int) for the 'anytime' strategy, the number of
+            best moves (by the heuristics) searched at each deeper ply.
+        rollouts: (int or None) for the 'mcts' strategy, the number of
+            rollouts per move. If None, the time budget is used instead.
+        processes: (int) for the 'mcts' strategy, the number of processes
+            that search in parallel.
+        noise: (float) the relative size of the random noise that is
+            added to the weights on every move.
+        opening_book: (OpeningBook, string path of a book, or None) if
+            given, the moves in the book are played while the game is
+            in the book.
+        endgame: (int) when the player has at most this many moves, the
+            move is found by the exact endgame solver (see endgame.py)
+            instead of the strategy. 0 turns the solver off.
+        endgame_nodes: (int) the number of positions that the endgame
+            solver may visit, after which the strategy is used.
         """
         colors = ['blue', 'red', 'green', 'yellow']
         self.playerID = playerID
@@ -35,163 +74,307 @@ class Player(object):
         self.strategy = strategy
         self.color = colors[self.playerID]
         self.weights = weights
+        self.time_budget = time_budget
+        self.search_width = search_width
+        self.rollouts = rollouts
+        self.processes = processes
+        self.noise = noise
+        if isinstance(opening_book, basestring):
+            from opening_book import get_book
+            opening_book = get_book(opening_book)
+        self.opening_book = opening_book
+        self.endgame = endgame
+        self.endgame_solver = None
+        if endgame > 0:
+            self.endgame_solver = EndgameSolver(node_limit=endgame_nodes)
 
     def __repr__(self):
         return ('player ' + str(self.playerID + 1) + ': ' + self.player_type)
 
     def make_move(self, game, pieces):
         if self.player_type != 'human':
-            # first find all available moves to make
-            moves = find_available_moves(game, pieces)
-            # print moves
-            #raise RuntimeError('')
-            if self.strategy == 'random':
-                # choose one move at random
-                move = moves[np.random.randint(0, len(moves))]
-            elif self.strategy == 'markov rule':
-                # choose the optimum next move
-                # but add rounding to the move_metric, and
-                # then randomly select amongst the degenerate
-                # best moves.
-                active_rules = [
-                    self.rule_1,
-                    self.rule_2,
-                    self.rule_3,
-                    self.rule_4,
-                    self.rule_5,
-                    self.rule_6]
-                data = determine_available_point_change(moves, game, pieces)
-                metric = np.zeros([len(moves)])
-                metrics = []
-                for i in xrange(len(active_rules)):
-                    current_metric = active_rules[i](moves, game, pieces, data)
-                    scaled_metric = self.weights[
-                        i] * (1 + .2 * np.random.normal(0, 1)) * current_metric
-                    metric = metric + scaled_metric
-                    metrics += [current_metric.tolist()]
-                metric = metric.tolist()
-                metric = [int(item) for item in metric]
-                Max = max(metric)
-                Inds = [i for i in xrange(len(metric)) if metric[i] == Max]
-                Ind = Inds[np.random.randint(0, len(Inds))]
-                move = moves[Ind]
-                move_metric = [m[Ind] for m in metrics]
-                print move_metric
-            elif self.strategy == 'third':
-                active_rules = [
-                    self.rule_1,
-                    self.rule_2,
-                    self.rule_3,
-                    self.rule_4,
-                    self.rule_5,
-                    self.rule_6]
-                data = determine_available_point_change(moves, game, pieces)
-                metric = np.ones([len(moves)])
-                metrics = []
-                for i in xrange(len(active_rules)):
-                    current_metric = active_rules[i](moves, game, pieces, data)
-                    current_metric[current_metric <= 0] = 0
-                    current_metric += 1
-                    scaled_metric = current_metric**(self.weights[i])
-                    metric = metric * scaled_metric
-                    metrics += [current_metric.tolist()]
-                metric[np.isnan(metric)] = 0
-                metric = metric.tolist()
-                metric = [int(item) for item in metric]
-                Max = max(metric)
-                Inds = [i for i in xrange(len(metric)) if metric[i] == Max]
-                Ind = Inds[np.random.randint(0, len(Inds))]
-                move = moves[Ind]
-                move_metric = [m[Ind] for m in metrics]
-                print move_metric
-            elif self.strategy == 'dual rule':
-                # first find several reasonably good moves by the same method as the
-                # markov rule:
-
-                active_rules = [
-                    self.rule_1,
-                    self.rule_2,
-                    self.rule_3,
-                    self.rule_4,
-                    self.rule_5,
-                    self.rule_6]
-
-                new_game = copy.deepcopy(game)
-                new_pieces = copy.deepcopy(pieces)
-
-                data = determine_available_point_change(
-                    moves, new_game, new_pieces)
-                metric = np.zeros([len(moves)])
-                metrics = []
-                for i in xrange(len(active_rules)):
-                    current_metric = active_rules[i](
-                        moves, game, new_pieces, data)
-                    scaled_metric = self.weights[
-                        i] * (1 + .2 * np.random.normal(0, 1)) * current_metric
-                    metric = metric + scaled_metric
-                    metrics += [current_metric.tolist()]
-                metric = metric.tolist()
-                metric = [item for item in metric]
-                Inds = np.argsort(metric).tolist()
-                Inds.reverse()
-                Num = 3
-                Inds = Inds[0:Num]
-                moves = [moves[ind] for ind in Inds]
-                metric = [metric[ind] for ind in Inds]
-                index = -1
-                for move in moves:
-                    index += 1
-                    new_game = copy.deepcopy(game)
-                    new_pieces = copy.deepcopy(pieces)
-                    first_piece = Piece(
-                        move['pieceID'],
-                        move['playerID'],
-                        rotation=move['rotation'],
-                        parity=move['parity'])
-                    new_game.place_piece(first_piece, move['position'])
-                    new_game.current_playerID = move['playerID']
-                    new_pieces.pop(move['index'])
-
-                    new_moves = find_available_moves(new_game, new_pieces)
-
-                    if len(new_moves) != 0:
-                        new_data = determine_available_point_change(
-                            new_moves, new_game, new_pieces)
-                        new_metric = np.zeros([len(new_moves)])
-
-                        for i in xrange(len(active_rules)):
-                            current_metric = active_rules[i](
-                                new_moves, new_game, new_pieces, new_data)
-                            scaled_metric = self.weights[
-                                i] * (1 + .2 * np.random.normal(0, 1)) * current_metric
-                            new_metric = new_metric + scaled_metric
-
-                        new_metric = new_metric.tolist()
-                        metric[index] = metric[index] * sum(new_metric)
-
-                Max = max(metric)
-                Inds = [i for i in xrange(len(metric)) if metric[i] == Max]
-                Ind = Inds[np.random.randint(0, len(Inds))]
-                move = moves[Ind]
-
-                print metric[Ind]
+            instrument.begin_turn(self.playerID, self.strategy)
+            # the turn is closed even if the move fails, so that the
+            # profiler and the record of the turn are not left running.
+            info = {}
+            try:
+                # first find all available moves to make
+                moves = self.available_moves(game, pieces)
+                num_moves = info['moves'] = len(moves)
+                book_move = None
+                if self.opening_book is not None:
+                    book_move = self.opening_book.find_move(
+                        self.strategy, self.weights, game, moves)
+                # print moves
+                #raise RuntimeError('')
+                endgame_move = None
+                if book_move is None and 0 < num_moves <= self.endgame:
+                    with instrument.timer('endgame'):
+                        endgame_move = self.solve_endgame(game, moves)
+                if book_move is not None:
+                    move = book_move
+                elif endgame_move is not None:
+                    move = endgame_move
+                elif self.strategy == 'random':
+                    # choose one move at random
+                    move = moves[np.random.randint(0, len(moves))]
+                elif self.strategy == 'markov rule':
+                    # choose the optimum next move
+                    # but add rounding to the move_metric, and
+                    # then randomly select amongst the degenerate
+                    # best moves.
+                    rule_metrics = self.rule_metrics(moves, game, pieces)
+                    metric = np.dot(self.noisy_weights(), rule_metrics)
+                    metric = metric.astype(int)
+                    Inds = np.flatnonzero(metric == np.max(metric))
+                    Ind = Inds[np.random.randint(0, len(Inds))]
+                    move = moves[Ind]
+                    move_metric = rule_metrics[:, Ind].tolist()
+                    print move_metric
+                elif self.strategy == 'third':
+                    rule_metrics = np.maximum(
+                        self.rule_metrics(moves, game, pieces), 0) + 1
+                    metric = np.prod(
+                        rule_metrics ** np.array(self.weights, dtype=float)[:, None],
+                        axis=0)
+                    metric[np.isnan(metric)] = 0
+                    metric = metric.astype(int)
+                    Inds = np.flatnonzero(metric == np.max(metric))
+                    Ind = Inds[np.random.randint(0, len(Inds))]
+                    move = moves[Ind]
+                    move_metric = rule_metrics[:, Ind].tolist()
+                    print move_metric
+                elif self.strategy == 'dual rule':
+                    # first find several reasonably good moves by the same method as the
+                    # markov rule:
+                    rule_metrics = self.rule_metrics(moves, game, pieces)
+                    metric = np.dot(self.noisy_weights(), rule_metrics)
+                    Inds = np.argsort(metric).tolist()
+                    Inds.reverse()
+                    Num = 3
+                    Inds = Inds[0:Num]
+                    moves = [moves[ind] for ind in Inds]
+                    metric = [metric[ind] for ind in Inds]
+                    index = -1
+                    for move in moves:
+                        index += 1
+                        # look ahead by making the move on the game itself,
+                        # and taking it back afterwards. The remaining pieces
+                        # are tracked by the game, so the piece widgets are
+                        # not needed.
+                        with instrument.timer('lookahead'):
+                            game.apply_move(move)
+                            try:
+                                game.set_current_player(move['playerID'])
 
-            else:
-                raise RuntimeError('unknown strategy type.')
+                                new_moves = self.available_moves(game, None)
+
+                                if len(new_moves) != 0:
+                                    new_rule_metrics = self.rule_metrics(
+                                        new_moves, game, None)
+                                    new_metric = np.dot(self.noisy_weights(),
+                                                        new_rule_metrics)
+                                    metric[index] = (metric[index] *
+                                                     np.sum(new_metric))
+                            finally:
+                                game.undo_move()
+
+                    Max = max(metric)
+                    Inds = [i for i in xrange(len(metric)) if metric[i] == Max]
+                    Ind = Inds[np.random.randint(0, len(Inds))]
+                    move = moves[Ind]
+
+                    print metric[Ind]
+
+                elif self.strategy == 'anytime':
+                    # iterative deepening search that returns the best move
+                    # found so far when the time budget runs out.
+                    with instrument.timer('lookahead'):
+                        move = self.anytime_search(moves, game, pieces)
+
+                elif self.strategy == 'mcts':
+                    # monte carlo tree search, with the rollouts spread over
+                    # a pool of processes.
+                    if self.rollouts is None:
+                        budget = {'time_budget': self.time_budget}
+                    else:
+                        budget = {'rollouts': self.rollouts}
+                    with instrument.timer('lookahead'):
+                        best = parallel_search(game, processes=self.processes,
+                                               **budget)
+                    moves_by_key = dict((move_key(m), m) for m in moves)
+                    move = moves_by_key[move_key(best)]
+
+                else:
+                    raise RuntimeError('unknown strategy type.')
+            finally:
+                instrument.end_turn(**info)
             # now that I have chosen my move, make it
         else:
             move = []
         return move
 
+    def solve_endgame(self, game, moves):
+        """
+        the move in moves that places the most squares by the end of the
+        game, according to the endgame solver, or None if the solver
+        gave up.
+        """
+        result = self.endgame_solver.solve(game, self.playerID)
+        if result is None or result[1] is None:
+            return None
+        best = result[1]
+        for move in moves:
+            if (move['orientation'] == best['orientation'] and
+                    tuple(move['position']) == tuple(best['position'])):
+                return move
+        return None
+
+    def available_moves(self, game, pieces):
+        """
+        find_available_moves for the current player, cached in
+        TRANSPOSITIONS under the hash of the position.
+        """
+        key = ('moves', game.hash, pieces is None)
+        moves = TRANSPOSITIONS.get(key)
+        if moves is None:
+            with instrument.timer('move generation'):
+                moves = find_available_moves(game, pieces)
+            TRANSPOSITIONS.put(key, moves)
+        return moves
+
+    def rule_metrics(self, moves, game, pieces):
+        """
+        the unweighted value of each of the heuristic rules for every
+        move, as an array with one row per rule. moves must be the list
+        returned by available_moves for this position, since the result
+        is cached in TRANSPOSITIONS under the hash of the position.
+        """
+        key = ('metrics', game.hash, pieces is None)
+        metrics = TRANSPOSITIONS.get(key)
+        if metrics is None:
+            with instrument.timer('corner delta'):
+                data = determine_available_point_change(moves, game, pieces)
+            metrics = move_features(moves, game, data).T
+            metrics.flags.writeable = False
+            TRANSPOSITIONS.put(key, metrics)
+        return metrics
+
+    def noisy_weights(self):
+        """
+        the weights of the rules, each with random noise (20% by default).
+        """
+        weights = np.array(self.weights, dtype=float)
+        if self.noise == 0:
+            return weights
+        return weights * (1 + self.noise *
+                          np.random.normal(0, 1, size=len(weights)))
+
+    def order_moves(self, moves, game, pieces):
+        """
+        the indices of the moves sorted from the best to the worst
+        according to the weighted heuristic rules.
+        """
+        metric = np.dot(self.weights, self.rule_metrics(moves, game, pieces))
+        return np.argsort(-metric, kind='mergesort').tolist()
+
+    def evaluate(self, game):
+        """
+        value of a position for this player: the number of squares the
+        player has placed, plus half the number of their corners, relative
+        to the best of the other players.
+        """
+        values = [sum(PIECE_SIZES[pieceID] for pieceID in PIECE_SIZES) -
+                  sum(PIECE_SIZES[pieceID] for pieceID in game.remaining[i]) +
+                  .5 * len(game.corners[i])
+                  for i in xrange(game.num_players)]
+        own = values.pop(self.playerID)
+        return own - max(values)
+
+    def anytime_search(self, moves, game, pieces):
+        """
+        search the game tree with iterative deepening: first one ply deep,
+        then two, and so on until the time budget runs out. At each ply the
+        moves are searched in the order given by the heuristic rules, and
+        below the first ply only the best search_width moves are searched.
+        Opponents are assumed to play against this player (paranoid search),
+        which allows alpha-beta pruning.
+
+        returns the best move of the deepest search that was completed,
+        or the best move by the heuristics if there was no time for any.
+        """
+        deadline = time.time() + self.time_budget / 1000.
+        order = self.order_moves(moves, game, pieces)
+        best = order[0]
+        depth = 1
+        max_depth = sum(len(remaining) for remaining in game.remaining)
+        while depth <= max_depth:
+            try:
+                value, best = self._search_root(moves, order, game,
+                                                depth, deadline)
+            except _OutOfTime:
+                break
+            # search the best move first in the next iteration
+            order = [best] + [i for i in order if i != best]
+            depth += 1
+        instrument.annotate(depth=depth - 1)
+        return moves[best]
+
+    def _search_root(self, moves, order, game, depth, deadline):
+        alpha = -np.inf
+        best = order[0]
+        for i in order:
+            game.apply_move(moves[i])
+            try:
+                value = self._search(game, depth - 1, alpha, np.inf,
+                                     deadline, 0)
+            finally:
+                game.undo_move()
+            if value > alpha:
+                alpha = value
+                best = i
+        return alpha, best
+
+    def _search(self, game, depth, alpha, beta, deadline, passes):
+        if time.time() > deadline:
+            raise _OutOfTime()
+        if depth == 0 or passes >= game.num_players:
+            return self.evaluate(game)
+
+        moves = self.available_moves(game, None)
+        if len(moves) == 0:
+            # this player has to skip their turn.
+            state = (game.current_playerID, game.round, game.hash)
+            game.increment_turn()
+            try:
+                return self._search(game, depth, alpha, beta,
+                                    deadline, passes + 1)
+            finally:
+                game.current_playerID, game.round, game.hash = state
+
+        maximize = (game.current_playerID == self.playerID)
+        order = self.order_moves(moves, game, None)[:self.search_width]
+        for i in order:
+            game.apply_move(moves[i])
+            try:
+                value = self._search(game, depth - 1, alpha, beta,
+                                     deadline, 0)
+            finally:
+                game.undo_move()
+            if maximize:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        return alpha if maximize else beta
+
     def rule_1(self, moves, game, pieces, data):
         """
         try to put down larger pieces first
-        return float [0,1] for each move in a list
         """
-        metric = []
-        for i in xrange(len(moves)):
-            metric += [(len(pieces[moves[i]['index']].piece))]
-        return np.array(metric)
+        orientations, positions = move_arrays(moves)
+        return ORIENTATION_SIZES[orientations]
 
     def rule_2(self, moves, game, pieces, data):
         """
@@ -204,22 +387,8 @@ class Player(object):
         """
         keep away from the walls
         """
-        dimension = game.board.shape[0]
-        half_dim = np.floor(dimension / 2.)
-        board_center = (half_dim, half_dim)
-
-        centered = []
-        for move in moves:
-            piece_pos = move['position']
-            size = pieces[move['index']].piece.geometry.shape
-            piece_pos = (
-                piece_pos[0] + size[0] / 2.,
-                piece_pos[1] + size[1] / 2.)
-            dist = np.sqrt((piece_pos[0] - board_center[0])
-                           ** 2 + (piece_pos[1] - board_center[1])**2)
-            centered += [half_dim - dist]
-
-        return np.array(centered)
+        orientations, positions = move_arrays(moves)
+        return find_centrality(game, orientations, positions)
 
     def rule_4(self, moves, game, pieces, data):
         """
@@ -232,51 +401,22 @@ class Player(object):
         """
         try to share edge space with opponents as much as possible
         """
-        metric = []
-        test_board = copy.deepcopy(game.board)
-        for move in moves:
-            t_board = test_board
-            t_piece = Piece(
-                move['pieceID'],
-                move['playerID'],
-                rotation=move['rotation'],
-                parity=move['parity'])
-            position = move['position']
-            t_board = t_piece.place_on_board(t_board, position)
-            after = find_edge_sharing(
-                t_board,
-                game.current_playerID,
-                position=move['position'],
-                size=t_piece.geometry.shape)
-            # using before and after, encourages starting and crossing bridges
-            metric += [after]
-        return np.array(metric)
+        orientations, positions = move_arrays(moves)
+        return count_move_patterns(game, game.current_playerID,
+                                   orientations, positions, EDGE_PATTERNS)
 
     def rule_6(self, moves, game, pieces, data):
         """
         try to create bridges across other players gaps if at all possible.
         """
-        metric = []
-        test_board = copy.deepcopy(game.board)
-        for move in moves:
-            t_board = test_board
-            t_piece = Piece(
-                move['pieceID'],
-                move['playerID'],
-                rotation=move['rotation'],
-                parity=move['parity'])
-            position = move['position']
-            before = find_bridge_instances(
-                t_board,
-                game.current_playerID,
-                position=move['position'],
-                size=t_piece.geometry.shape)
-            t_board = t_piece.place_on_board(t_board, position)
-            after = find_bridge_instances(
-                t_board,
-                game.current_playerID,
-                position=move['position'],
-                size=t_piece.geometry.shape)
-            # using before and after, encourages starting and crossing bridges
-            metric += [before + after]
-        return np.array(metric)
\ No newline at end of file
+        orientations, positions = move_arrays(moves)
+        encoded = encode_board(game.board, game.current_playerID)
+        # using before and after, encourages starting and crossing bridges
+        before = count_move_patterns(game, game.current_playerID,
+                                     orientations, positions,
+                                     BRIDGE_PATTERNS, place=False,
+                                     encoded=encoded)
+        after = count_move_patterns(game, game.current_playerID,
+                                    orientations, positions, BRIDGE_PATTERNS,
+                                    encoded=encoded)
+        return before + after
@@ -0,0 +1,156 @@
+"""
+a compact binary file format for storing finished games.
+
+a record file starts with the 4 byte magic string 'BLKR' and a one byte
+format version, followed by any number of games. Every game is stored as
+
+    header length (uint32), number of moves (uint16),
+    header (json, utf-8),
+    moves (5 bytes each: playerID, pieceID, orientation, x, y)
+
+where the header is a dictionary with the strategies, weights, seed and
+final scores of the game, and the orientation is the index of the
+orientation of the piece in piece.ORIENTATIONS. Skipped turns are not
+stored, since they follow from the order of the players in the moves.
+
+games are appended one at a time by RecordWriter, so a file can grow to
+any number of games without holding them in memory, and read_records
+reads them back one at a time.
+"""
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from piece import ORIENTATIONS, ORIENTATION_INDEX
+
+MAGIC = 'BLKR'
+VERSION = 1
+
+MOVE_RECORD = np.dtype([('playerID', np.uint8),
+                        ('pieceID', np.uint8),
+                        ('orientation', np.uint8),
+                        ('x', np.uint8),
+                        ('y', np.uint8)])
+
+_GAME = struct.Struct('<IH')
+
+# a game read from a record file: header is a dictionary, and moves is an
+# array with the MOVE_RECORD dtype.
+GameRecord = namedtuple('GameRecord', ['header', 'moves'])
+
+
+def encode_history(history):
+    """
+    pack a list of moves, as in Game.history, into an array of MOVE_RECORD
+    """
+    moves = np.zeros(len(history), dtype=MOVE_RECORD)
+    for k, move in enumerate(history):
+        if 'orientation' in move:
+            orientation = move['orientation']
+        else:
+            orientation = ORIENTATION_INDEX[
+                (move['pieceID'], move['rotation'] % 4, move['parity'])]
+        moves[k] = (move['playerID'], move['pieceID'], orientation,
+                    move['position'][0], move['position'][1])
+    return moves
+
+
+def decode_moves(moves):
+    """
+    unpack an array of MOVE_RECORD into a list of move dictionaries,
+    with the same keys as the moves in Game.history.
+    """
+    history = []
+    for record in moves:
+        orientation = ORIENTATIONS[record['orientation']]
+        history += [{'playerID': int(record['playerID']),
+                     'pieceID': int(record['pieceID']),
+                     'orientation': orientation.index,
+                     'rotation': orientation.rotation,
+                     'parity': orientation.parity,
+                     'position': (int(record['x']), int(record['y']))}]
+    return history
+
+
+class RecordWriter(object):
+    """
+    This object appends games to a record file. The file is created with
+    the magic string and version if it does not exist yet, and every game
+    is flushed to the file as soon as it is written.
+
+    methods:
+    write: append a game, given its header and history.
+    close: close the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, 'a+b')
+        self.handle.seek(0, 2)
+        if self.handle.tell() == 0:
+            self.handle.write(MAGIC + struct.pack('<B', VERSION))
+        else:
+            self.handle.seek(0)
+            _check_magic(self.handle.read(len(MAGIC) + 1), path)
+            self.handle.seek(0, 2)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def write(self, header, history):
+        """
+        inputs:
+        header: (dict) information about the game that can be written as
+            json, such as the strategies, weights, seed and scores.
+        history: (list of move dictionaries, or an array of MOVE_RECORD)
+            the moves of the game, as in Game.history.
+        """
+        if not isinstance(history, np.ndarray):
+            history = encode_history(history)
+        header = json.dumps(header, sort_keys=True).encode('utf-8')
+        self.handle.write(_GAME.pack(len(header), len(history)))
+        self.handle.write(header)
+        self.handle.write(history.astype(MOVE_RECORD).tobytes())
+        self.handle.flush()
+        self.count += 1
+
+    def close(self):
+        self.handle.close()
+
+
+def read_records(path):
+    """
+    iterate over the games in a record file, as GameRecord tuples.
+    """
+    with open(path, 'rb') as handle:
+        _check_magic(handle.read(len(MAGIC) + 1), path)
+        while True:
+            data = handle.read(_GAME.size)
+            if len(data) == 0:
+                break
+            if len(data) < _GAME.size:
+                raise IOError('truncated game in ' + path)
+            header_size, num_moves = _GAME.unpack(data)
+            header = handle.read(header_size)
+            data = handle.read(num_moves * MOVE_RECORD.itemsize)
+            if (len(header) < header_size or
+                    len(data) < num_moves * MOVE_RECORD.itemsize):
+                raise IOError('truncated game in ' + path)
+            yield GameRecord(json.loads(header.decode('utf-8')),
+                             np.frombuffer(data, dtype=MOVE_RECORD))
+
+
+def _check_magic(data, path):
+    if len(data) < len(MAGIC) + 1 or data[:len(MAGIC)] != MAGIC:
+        raise IOError(path + ' is not a blokus record file')
+    version = struct.unpack('<B', data[len(MAGIC):])[0]
+    if version != VERSION:
+        raise IOError(path + ' has record format version ' + str(version) +
+                      ', but version ' + str(VERSION) + ' is supported')
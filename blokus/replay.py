@@ -0,0 +1,132 @@
+"""
+fast replay of finished games, for looking at their positions.
+
+the moves of a finished game are known to be allowed, so they are
+replayed with Game.apply_move(move, trusted=True), which skips the rules
+checks. A Replay keeps a snapshot of the game every few moves, so that
+any move of the game can be reached by restoring the closest snapshot
+before it and replaying at most that many moves.
+
+usage:
+
+    from blokus.replay import Replay, iter_positions
+
+    replay = Replay(history)
+    game = replay.seek(40)    # the position after 40 moves
+
+    for header, index, game in iter_positions('games.blkr'):
+        ...                   # every position of every recorded game
+"""
+import numpy as np
+
+from game import Game
+from records import read_records, decode_moves
+
+
+class Replay(object):
+    """
+    This object replays the moves of a finished game on a Game object.
+    Snapshots of the game are kept every interval moves as the replay
+    passes them, so going back to an earlier move costs at most interval
+    moves.
+
+    methods:
+    seek: move the replay to the position after a given number of moves.
+    step: make the next move.
+    positions: iterate over the positions of the game.
+    """
+
+    def __init__(self, history, dimension=20, num_players=4, interval=10,
+                 start_points=None):
+        """
+        inputs:
+        history: (list of move dictionaries, as in Game.history, or an
+            array of records.MOVE_RECORD) the moves of the game.
+        dimension: (int) size of the board.
+        num_players: (int) number of players in the game.
+        interval: (int) number of moves between snapshots.
+        start_points: (list of (i, j) cells or None) the start cell of
+            each player, by default the corners of the board.
+        """
+        if isinstance(history, np.ndarray):
+            history = decode_moves(history)
+        self.history = history
+        self.interval = interval
+        self.game = Game(dimension=dimension, num_players=num_players,
+                         start_points=start_points)
+        self.snapshots = {0: self.game.snapshot()}
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def index(self):
+        """
+        the number of moves that have been made on the game
+        """
+        return len(self.game.history)
+
+    def step(self):
+        """
+        make the next move of the game, and return the game.
+        """
+        index = self.index
+        problem = self.game.apply_move(self.history[index], trusted=True)
+        if problem != '':
+            raise RuntimeError('the recorded move ' + str(index) +
+                               ' is not allowed: ' + problem)
+        index += 1
+        if index % self.interval == 0 and index not in self.snapshots:
+            self.snapshots[index] = self.game.snapshot()
+        return self.game
+
+    def seek(self, index):
+        """
+        move the replay to the position after index moves, and return
+        the game. The game object is replaced when the replay has to go
+        back, so the returned game should be used instead of an older one.
+        """
+        if not 0 <= index <= len(self.history):
+            raise IndexError('move index out of range')
+        start = index - index % self.interval
+        while start not in self.snapshots:
+            start -= self.interval
+        if not start <= self.index <= index:
+            self.game = self.snapshots[start].snapshot()
+        while self.index < index:
+            self.step()
+        return self.game
+
+    def positions(self, start=0, stop=None, step=1):
+        """
+        iterate over the positions of the game after start, start + step,
+        ... moves, up to (but not including) stop moves, which defaults to
+        the end of the game. The same game object is updated and yielded
+        for every position, so it should be copied if it is to be kept.
+
+        yields (index, game) pairs.
+        """
+        if stop is None:
+            stop = len(self.history) + 1
+        for index in xrange(start, min(stop, len(self.history) + 1), step):
+            yield index, self.seek(index)
+
+
+def iter_positions(path, step=1, interval=10):
+    """
+    iterate over the positions of every game in a record file, every
+    step moves, for analysis or for extracting training data.
+
+    yields (header, index, game) tuples, where header is the header of
+    the game, and game is the position after index moves (see
+    Replay.positions).
+    """
+    for record in read_records(path):
+        header = record.header
+        replay = Replay(record.moves,
+                        dimension=header.get('dimension', 20),
+                        num_players=header.get('num_players', 4),
+                        interval=interval,
+                        start_points=header.get('start_points'))
+        for index, game in replay.positions(step=step):
+            yield header, index, game
@@ -0,0 +1,339 @@
+"""
+play batches of Blokus games between AI players without a display,
+spread across a pool of processes.
+
+usage:
+python -m blokus.selfplay --games 100 --output games.jsonl
+
+every finished game is written as one line of JSON to the output file,
+with the final scores, the time taken by every move, and the history
+of the game.
+"""
+from __future__ import division
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import time
+
+import numpy as np
+
+from blokus.game import Game, VARIANTS
+from blokus.piece import Piece, PIECE_SIZES
+from blokus.player import Player
+from blokus.settings import Settings
+from blokus import mcts
+from blokus import instrument
+from blokus.records import RecordWriter
+
+
+def play_game(players, dimension=20, seed=None, start_points=None):
+    """
+    play a single game between AI players until nobody can move.
+
+    inputs:
+    players: (list of Player objects) one AI player for each color.
+    dimension: (int) size of the board.
+    seed: (int or None) seed for the random number generator.
+    start_points: (list of (i, j) cells or None) the start cell of each
+        player, by default the corners of the board.
+
+    returns the finished Game object and a list with the time in
+    seconds that each move took to compute.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+
+    game = Game(dimension=dimension, num_players=len(players),
+                start_points=start_points)
+    move_times = []
+    skipped = 0
+    while skipped < game.num_players:
+        # if the current player cannot move, skip their turn.
+        if not game.has_legal_move():
+            game.increment_turn()
+            skipped += 1
+            continue
+        skipped = 0
+
+        start = time.time()
+        move = players[game.current_playerID].make_move(game, None)
+        move_times += [time.time() - start]
+
+        piece = Piece(move['pieceID'], move['playerID'],
+                      rotation=move['rotation'], parity=move['parity'])
+        problem = game.place_piece(piece, move['position'])
+        if problem != '':
+            raise RuntimeError('the AI made an invalid move: ' + problem)
+
+    return game, move_times
+
+
+def get_scores(game):
+    """
+    the number of squares that each player has placed on the board.
+    """
+    return [sum(PIECE_SIZES[h['pieceID']] for h in game.history
+                if h['playerID'] == playerID)
+            for playerID in xrange(game.num_players)]
+
+
+def _play_record(arguments):
+    """
+    play one game of a batch and summarize it in a dictionary
+    that can be written out as json.
+    """
+    index, seed, settings = arguments
+    players = [Player(i,
+                      player_type='ai',
+                      strategy=settings.player_strategies[i],
+                      weights=settings.player_weights[i],
+                      opening_book=settings.opening_book,
+                      endgame=settings.endgame)
+               for i in xrange(settings.num_players)]
+
+    start = time.time()
+    game, move_times = play_game(players,
+                                 dimension=settings.board_size,
+                                 seed=seed,
+                                 start_points=settings.start_points)
+    return {'game': index,
+            'seed': seed,
+            'strategies': settings.player_strategies,
+            'weights': settings.player_weights,
+            'scores': get_scores(game),
+            'duration': time.time() - start,
+            'move_times': move_times,
+            'history': game.history}
+
+
+def _quiet_worker(turns=None):
+    # the AI strategies print their move metrics, which would
+    # otherwise flood the output of the batch.
+    sys.stdout = open(os.devnull, 'w')
+    if turns is not None:
+        instrument.enable(output=turns)
+        # write the totals of the worker to the file when its process
+        # exits at the end of the batch.
+        multiprocessing.util.Finalize(None, instrument.disable,
+                                      exitpriority=10)
+
+
+def run_batch(num_games, settings, processes=None, seed=0, output=None,
+              turns=None, records=None, keep_records=False):
+    """
+    play num_games games across a pool of processes, and write each
+    finished game to the file output as a line of json, and to the
+    binary record file records (see records.py). If turns is given, the
+    time spent in every turn is recorded by the instrument module and
+    appended to that file.
+
+    the games are only written out, and added to the statistics of the
+    batch, so that the memory used does not grow with the number of
+    games. If keep_records is True, the summary of every game is also
+    kept, in the order in which they finished, in the records attribute
+    of the returned BatchSummary.
+
+    returns a BatchSummary.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    tasks = ((i, seed + i, settings) for i in xrange(num_games))
+    pool = multiprocessing.Pool(processes, initializer=_quiet_worker,
+                                initargs=(turns,))
+    handle = open(output, 'a') if output is not None else None
+    writer = RecordWriter(records) if records is not None else None
+    summary = BatchSummary(settings.num_players, keep_records=keep_records)
+    try:
+        for record in pool.imap_unordered(_play_record, tasks):
+            summary.add(record)
+            if handle is not None:
+                handle.write(json.dumps(record) + '\n')
+                handle.flush()
+            if writer is not None:
+                header = dict((key, record[key]) for key in
+                              ['game', 'seed', 'strategies', 'weights',
+                               'scores', 'duration'])
+                header['dimension'] = settings.board_size
+                header['num_players'] = settings.num_players
+                header['start_points'] = settings.start_points
+                writer.write(header, record['history'])
+    finally:
+        pool.close()
+        pool.join()
+        # and the pools of any mcts players of this process
+        mcts.close_pools()
+        if handle is not None:
+            handle.close()
+        if writer is not None:
+            writer.close()
+    return summary
+
+
+class BatchSummary(object):
+    """
+    This object adds up the statistics of a batch of games one game at a
+    time. The times of the moves are counted in a histogram with bins
+    that are 2.3% wide, from 10 microseconds to 1000 seconds, so the
+    median and the 95th percentile are found to within a bin without
+    keeping every time.
+
+    methods:
+    add: add the summary of a finished game.
+    quantile: a quantile of the time per move.
+    format: a few lines describing the batch.
+    """
+    # the edges of the bins of the move times
+    EDGES = np.logspace(-5, 3, 801)
+
+    def __init__(self, num_players=4, keep_records=False):
+        self.games = 0
+        self.moves = 0
+        self.move_time = 0.
+        self.histogram = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+        self.scores = np.zeros(num_players)
+        self.records = [] if keep_records else None
+
+    def __len__(self):
+        return self.games
+
+    def add(self, record):
+        move_times = np.asarray(record['move_times'], dtype=float)
+        self.games += 1
+        self.moves += len(move_times)
+        self.move_time += np.sum(move_times)
+        self.histogram += np.bincount(
+            np.searchsorted(self.EDGES, move_times),
+            minlength=len(self.histogram))
+        self.scores += record['scores']
+        if self.records is not None:
+            self.records += [record]
+
+    def quantile(self, q):
+        """
+        the time per move below which a fraction q of the moves took,
+        as the geometric centre of the bin that it falls in.
+        """
+        rank = np.searchsorted(np.cumsum(self.histogram), q * self.moves)
+        edges = np.concatenate([[0.], self.EDGES, [np.inf]])
+        low, high = edges[rank], edges[rank + 1]
+        if low == 0:
+            return high
+        if np.isinf(high):
+            return low
+        return np.sqrt(low * high)
+
+    def format(self, elapsed):
+        """
+        a few lines describing the throughput and the results of the batch
+        """
+        lines = ['games: %d in %.2f s (%.3f games/sec)'
+                 % (self.games, elapsed, self.games / elapsed)]
+        if self.moves > 0:
+            lines += ['moves: %d, time per move mean %.4f s, median %.4f s, '
+                      'p95 %.4f s' % (self.moves, self.move_time / self.moves,
+                                      self.quantile(.5),
+                                      self.quantile(.95))]
+        if self.games > 0:
+            lines += ['mean score per player: ' +
+                      ', '.join('%.1f' % s
+                                for s in self.scores / self.games)]
+        return '\n'.join(lines)
+
+
+def _per_player(parser, option, values, num_players):
+    """
+    the values of a command line option with one value for every player,
+    where a single value is used for all of the players.
+    """
+    if values is None:
+        return None
+    if len(values) == 1:
+        return list(values) * num_players
+    if len(values) != num_players:
+        parser.error(option + ' should have 1 or ' + str(num_players) +
+                     ' values, not ' + str(len(values)))
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='play batches of Blokus games between AI players.')
+    parser.add_argument('--games', type=int, default=10,
+                        help='number of games to play')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='size of the process pool (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game, game i uses seed + i')
+    parser.add_argument('--output', default=None,
+                        help='json lines file to append the games to')
+    parser.add_argument('--strategies', nargs='+', default=None,
+                        help='strategy of each player, or one for all '
+                             'of them')
+    parser.add_argument('--weights', default=None,
+                        help='json list with the weights of each player, '
+                             'or of one player for all of them')
+    parser.add_argument('--board-size', type=int, default=20)
+    parser.add_argument('--players', type=int, default=4,
+                        help='number of players (2 to 4)')
+    parser.add_argument('--start-points', default=None,
+                        help='json list with the start cell of each player '
+                             '(default: the corners of the board)')
+    parser.add_argument('--variant', default=None, choices=sorted(VARIANTS),
+                        help='play a variant of the game, which sets the '
+                             'board size, players and start points')
+    parser.add_argument('--book', default=None,
+                        help='opening book for the AI players')
+    parser.add_argument('--endgame', type=int, default=0,
+                        help='use the exact endgame solver when a player '
+                             'has at most this many moves')
+    parser.add_argument('--records', default=None,
+                        help='binary record file to append the games to')
+    parser.add_argument('--turns', default=None,
+                        help='json lines file to append the timings of '
+                             'every turn, and the totals of every worker, to')
+    args = parser.parse_args(argv)
+
+    num_players = args.players
+    if args.variant is not None:
+        num_players = VARIANTS[args.variant]['num_players']
+    if not 2 <= num_players <= 4:
+        parser.error('a game has 2 to 4 players')
+    weights = json.loads(args.weights) if args.weights else None
+    if weights is not None and not isinstance(weights[0], list):
+        # the weights of a single player
+        weights = [weights]
+    start_points = (json.loads(args.start_points)
+                    if args.start_points else None)
+    if start_points is not None and len(start_points) != num_players:
+        parser.error('--start-points should have a cell for each of the ' +
+                     str(num_players) + ' players')
+    strategies = _per_player(parser, '--strategies', args.strategies,
+                             num_players)
+    weights = _per_player(parser, '--weights', weights, num_players)
+    settings = Settings(player_strategies=strategies,
+                        player_weights=weights,
+                        board_size=args.board_size,
+                        num_players=num_players,
+                        start_points=start_points,
+                        variant=args.variant,
+                        opening_book=args.book,
+                        endgame=args.endgame,
+                        headless=True)
+
+    start = time.time()
+    summary = run_batch(args.games, settings,
+                        processes=args.processes,
+                        seed=args.seed,
+                        output=args.output,
+                        turns=args.turns,
+                        records=args.records)
+    print summary.format(time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
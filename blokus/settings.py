@@ -3,8 +3,7 @@ from __future__ import division
 import numpy as np
 import copy
 
-from kivy.config import Config
-from kivy.core.window import Window
+from game import VARIANTS
 
 
 class Settings(object):
@@ -31,10 +30,30 @@ class Settings(object):
 				 player_strategies=None,
 				 player_weights=None,
 				 show_all=True,
+				 headless=False,
+				 opening_book=None,
+				 endgame=0,
+				 start_points=None,
+				 variant=None,
 				 **kwargs):
 		"""
 		inputs:
+		headless: (bool) if True, do not configure the kivy window.
+			this is used when playing games without a display.
+		opening_book: (string or None) path of an opening book for
+			the AI players (see opening_book.py).
+		endgame: (int) the number of moves below which the AI players
+			use the exact endgame solver (see endgame.py), 0 for never.
+		start_points: (list of (i, j) cells or None) the start cell of
+			each player, by default the corners of the board.
+		variant: (string or None) the name of a variant in
+			game.VARIANTS, such as 'duo', which sets the board size, the
+			number of players and the start points.
 		"""
+		if variant is not None:
+			board_size   = VARIANTS[variant]['dimension']
+			num_players  = VARIANTS[variant]['num_players']
+			start_points = VARIANTS[variant]['start_points']
 
 		self.screen_mode = screen_mode
 		self.num_players = num_players
@@ -42,6 +61,9 @@ class Settings(object):
 		self.board_size  = board_size
 		self.frame_rate  = frame_rate
 		self.show_all    = show_all
+		self.opening_book = opening_book
+		self.endgame      = endgame
+		self.start_points = start_points
 
 		self.set_player_properties(
 							  player_types,
@@ -66,7 +88,8 @@ class Settings(object):
 		self.current_grid_size   = self.grid_size[self.screen_mode]
 
 		self.get_block_length()
-		self.set_screen()
+		if not headless:
+			self.set_screen()
 
 
 	def get_block_length(self):
@@ -95,6 +118,11 @@ class Settings(object):
 								for location in self.corner_offset]
 
 	def set_screen(self):
+		# kivy is only imported here so that the settings can be used
+		# by the game engine without a display.
+		from kivy.config import Config
+		from kivy.core.window import Window
+
 		Window.size = self.current_screen_size
 		Config.set('graphics', 'width',  self.current_screen_size[0])
 		Config.set('graphics', 'height', self.current_screen_size[1])
@@ -109,12 +137,12 @@ class Settings(object):
 		self.player_types = player_types
 
 		if player_strategies is None:
-			player_strategies = ['third'] * 3 + ['dual rule']
+			player_strategies = (['third'] * 3 + ['dual rule'])[-self.num_players:]
 		self.player_strategies = player_strategies
 
 		if player_weights is None:
 			player_weights =   [[1, 0, .5, 0, 3, 2], 
 								[2, 0, 2, 0, 1, 3], 
 								[2, 2, 2, 0, 2, 2], 
-								[1, 2, 2, .5, 20, 10]]
+								[1, 2, 2, .5, 20, 10]][-self.num_players:]
 		self.player_weights = player_weights
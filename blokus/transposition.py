@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class TranspositionTable(object):
+    """
+    A bounded cache of values keyed on position hashes. When the table
+    is full, the least recently used entry is evicted.
+
+    methods:
+    get: look up a key, returning default if it is not in the table.
+    put: store a value, evicting the oldest entry if the table is full.
+    clear: remove every entry.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __repr__(self):
+        return ('TranspositionTable(' + str(len(self)) + '/' +
+                str(self.capacity) + ', hits=' + str(self.hits) +
+                ', misses=' + str(self.misses) + ')')
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # reinsert the entry so that it becomes the most recently used
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
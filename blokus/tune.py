@@ -0,0 +1,339 @@
+"""
+tune the weights of the heuristic AI strategies by self-play.
+
+the weights of one strategy ('markov rule', 'third' or 'dual rule') are
+optimized with the cross-entropy method: every generation, a population
+of weight vectors is drawn from a normal distribution, every candidate
+plays a batch of games against the default players of Settings (taking
+every seat in turn), and the distribution is moved to the mean and
+spread of the candidates with the best win-rates. The games of all of
+the candidates of a generation are played across a pool of processes,
+and every candidate plays the same seeds, so that the candidates are
+compared on the same games.
+
+after every generation the state of the search, and the wins of every
+candidate with a 95% confidence interval, are written to a json
+checkpoint, from which the search continues if it is run again.
+
+usage:
+python -m blokus.tune --strategy third --generations 20 --population 16 \\
+    --games 200 --checkpoint tune_third.json
+"""
+from __future__ import division
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from blokus.game import VARIANTS
+from blokus.player import Player
+from blokus.selfplay import play_game, get_scores, _quiet_worker
+from blokus.settings import Settings
+from blokus import mcts
+
+STRATEGIES = ['markov rule', 'third', 'dual rule']
+NUM_WEIGHTS = 6
+
+
+def wilson_interval(wins, games, z=1.96):
+    """
+    the wilson score interval of a win-rate of wins out of games, which
+    is 95% by default. Returns (low, high).
+    """
+    if games == 0:
+        return 0., 1.
+    rate = wins / games
+    denominator = 1 + z ** 2 / games
+    centre = (rate + z ** 2 / (2 * games)) / denominator
+    spread = (z * np.sqrt(rate * (1 - rate) / games +
+                          z ** 2 / (4 * games ** 2)) / denominator)
+    return max(0., centre - spread), min(1., centre + spread)
+
+
+def _play_candidate(arguments):
+    """
+    play one game between a candidate and the default players, and
+    return the index of the candidate, its share of the win (ties are
+    split) and its score minus the best score of the others.
+    """
+    candidate, seed, seat, strategy, weights, settings = arguments
+    players = []
+    for i in xrange(settings.num_players):
+        if i == seat:
+            players += [Player(i, player_type='ai', strategy=strategy,
+                               weights=weights)]
+        else:
+            players += [Player(i, player_type='ai',
+                               strategy=settings.player_strategies[i],
+                               weights=settings.player_weights[i])]
+    game, _ = play_game(players, dimension=settings.board_size, seed=seed,
+                        start_points=settings.start_points)
+    scores = get_scores(game)
+    best = max(scores)
+    win = 0.
+    if scores[seat] == best:
+        win = 1 / scores.count(best)
+    others = max(s for i, s in enumerate(scores) if i != seat)
+    return candidate, win, scores[seat] - others
+
+
+class CrossEntropySearch(object):
+    """
+    This object holds the state of the cross-entropy search over the
+    weights of a strategy.
+
+    methods:
+    sample: draw the candidates of the next generation.
+    update: move the distribution towards the best candidates.
+    save / load: write and read the json checkpoint.
+    """
+
+    def __init__(self, strategy, mean=None, std=None, elite=.25,
+                 smoothing=.7, min_std=.1, seed=0):
+        """
+        inputs:
+        strategy: (string) the strategy whose weights are tuned.
+        mean: (list of floats) the initial weights, by default the
+            weights of the first player of Settings with this strategy.
+        std: (list of floats) the initial spread of the weights.
+        elite: (float) the fraction of the candidates that the
+            distribution is fit to.
+        smoothing: (float) the weight of the new fit in the mean and
+            spread, the rest is kept from the last generation.
+        min_std: (float) the smallest spread of every weight, which keeps
+            the search from collapsing on the noise of the win-rates.
+        seed: (int) seed of the candidates and of the games.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError('can not tune the weights of ' + strategy)
+        if mean is None:
+            mean = _default_weights(strategy)
+        if std is None:
+            std = [max(1., .5 * abs(w)) for w in mean]
+        self.strategy = strategy
+        self.mean = np.array(mean, dtype=float)
+        self.std = np.array(std, dtype=float)
+        self.elite = elite
+        self.smoothing = smoothing
+        self.min_std = min_std
+        self.seed = seed
+        self.generation = 0
+        self.history = []
+
+    def sample(self, population):
+        """
+        draw population weight vectors, the first of which is the mean.
+        The weights are not negative, like the weights of the defaults.
+        """
+        state = np.random.RandomState(self.seed + self.generation)
+        candidates = state.normal(self.mean, self.std,
+                                  size=(population, NUM_WEIGHTS))
+        candidates[0] = self.mean
+        return np.round(np.clip(candidates, 0, None), 3)
+
+    def update(self, candidates, results):
+        """
+        fit the distribution to the candidates with the best win-rates,
+        and record the generation.
+
+        inputs:
+        candidates: (population x 6 array) the weights of the candidates.
+        results: (list of dicts) the wins, games and margin of every
+            candidate, as returned by evaluate.
+        """
+        rates = np.array([r['wins'] / max(r['games'], 1) for r in results])
+        margins = np.array([r['margin'] for r in results])
+        # the mean margin breaks ties between equal win-rates
+        order = np.lexsort((-margins, -rates))
+        num_elite = max(2, int(round(self.elite * len(candidates))))
+        elite = candidates[order[:num_elite]]
+
+        a = self.smoothing
+        self.mean = a * elite.mean(axis=0) + (1 - a) * self.mean
+        self.std = np.maximum(a * elite.std(axis=0) + (1 - a) * self.std,
+                              self.min_std)
+
+        report = []
+        for k in order:
+            result = results[k]
+            low, high = wilson_interval(result['wins'], result['games'])
+            report += [{'weights': candidates[k].tolist(),
+                        'wins': result['wins'],
+                        'games': result['games'],
+                        'win_rate': rates[k],
+                        'interval': [low, high],
+                        'margin': margins[k]}]
+        self.history += [{'generation': self.generation,
+                          'candidates': report,
+                          'mean': self.mean.tolist(),
+                          'std': self.std.tolist()}]
+        self.generation += 1
+        return report
+
+    def save(self, path):
+        state = {'strategy': self.strategy,
+                 'mean': self.mean.tolist(),
+                 'std': self.std.tolist(),
+                 'elite': self.elite,
+                 'smoothing': self.smoothing,
+                 'min_std': self.min_std,
+                 'seed': self.seed,
+                 'generation': self.generation,
+                 'history': self.history}
+        # write to a temporary file first, so that an interrupted run
+        # does not leave a broken checkpoint behind.
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(state, handle, indent=1)
+        os.rename(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            state = json.load(handle)
+        search = cls(state['strategy'], mean=state['mean'],
+                     std=state['std'], elite=state['elite'],
+                     smoothing=state['smoothing'],
+                     min_std=state['min_std'], seed=state['seed'])
+        search.generation = state['generation']
+        search.history = state['history']
+        return search
+
+
+def _default_weights(strategy):
+    settings = Settings(headless=True)
+    for name, weights in zip(settings.player_strategies,
+                             settings.player_weights):
+        if name == strategy:
+            return list(weights)
+    return list(settings.player_weights[0])
+
+
+def evaluate(pool, strategy, candidates, games, settings, seed=0):
+    """
+    play games games for every candidate against the players of
+    settings, with the candidate in every seat in turn, across the
+    process pool.
+
+    returns a list with the wins, games and mean margin of every
+    candidate.
+    """
+    tasks = [(k, seed + g, g % settings.num_players, strategy,
+              candidates[k].tolist(), settings)
+             for g in xrange(games)
+             for k in xrange(len(candidates))]
+    results = [{'wins': 0., 'games': 0, 'margin': 0.}
+               for _ in xrange(len(candidates))]
+    for candidate, win, margin in pool.imap_unordered(_play_candidate,
+                                                      tasks, chunksize=4):
+        result = results[candidate]
+        result['wins'] += win
+        result['games'] += 1
+        result['margin'] += margin
+    for result in results:
+        result['margin'] /= max(result['games'], 1)
+    return results
+
+
+def tune(search, generations, population, games, settings,
+         processes=None, checkpoint=None):
+    """
+    run generations generations of the search, and write the checkpoint
+    after every one of them.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, initializer=_quiet_worker)
+    try:
+        for _ in xrange(generations):
+            start = time.time()
+            candidates = search.sample(population)
+            # the seeds of a generation are shared by its candidates
+            seed = search.seed + search.generation * games
+            results = evaluate(pool, search.strategy, candidates, games,
+                               settings, seed=seed)
+            report = search.update(candidates, results)
+            if checkpoint is not None:
+                search.save(checkpoint)
+            print format_report(search.generation - 1, report,
+                                time.time() - start)
+    finally:
+        pool.close()
+        pool.join()
+        # and the pools of any mcts players of this process
+        mcts.close_pools()
+    return search
+
+
+def format_report(generation, report, elapsed, top=5):
+    """
+    a few lines with the best candidates of a generation
+    """
+    games = sum(r['games'] for r in report)
+    lines = ['generation %d: %d games in %.1f s'
+             % (generation, games, elapsed)]
+    for r in report[:top]:
+        lines += ['  win-rate %.3f [%.3f, %.3f]  margin %+6.1f  weights %s'
+                  % (r['win_rate'], r['interval'][0], r['interval'][1],
+                     r['margin'], json.dumps(r['weights']))]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='tune the weights of an AI strategy by self-play.')
+    parser.add_argument('--strategy', default='third', choices=STRATEGIES)
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--population', type=int, default=16,
+                        help='number of candidates in every generation')
+    parser.add_argument('--games', type=int, default=100,
+                        help='number of games played by every candidate')
+    parser.add_argument('--elite', type=float, default=.25,
+                        help='fraction of the candidates that the next '
+                             'generation is drawn around')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='size of the process pool (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--weights', default=None,
+                        help='json list with the initial weights')
+    parser.add_argument('--opponents', nargs='+', default=None,
+                        help='strategy of each opponent seat')
+    parser.add_argument('--opponent-weights', default=None,
+                        help='json list with the weights of each seat')
+    parser.add_argument('--checkpoint', default=None,
+                        help='json file with the state of the search, '
+                             'which is continued if it exists')
+    parser.add_argument('--board-size', type=int, default=20)
+    parser.add_argument('--variant', default=None, choices=sorted(VARIANTS),
+                        help='a variant of the game, which sets the board '
+                             'size, players and start points')
+    args = parser.parse_args(argv)
+
+    opponent_weights = (json.loads(args.opponent_weights)
+                        if args.opponent_weights else None)
+    settings = Settings(player_strategies=args.opponents,
+                        player_weights=opponent_weights,
+                        board_size=args.board_size,
+                        variant=args.variant,
+                        headless=True)
+
+    if args.checkpoint is not None and os.path.exists(args.checkpoint):
+        search = CrossEntropySearch.load(args.checkpoint)
+        if search.strategy != args.strategy:
+            parser.error(args.checkpoint + ' tunes ' + search.strategy)
+        print 'continuing from generation', search.generation
+    else:
+        weights = json.loads(args.weights) if args.weights else None
+        search = CrossEntropySearch(args.strategy, mean=weights,
+                                    elite=args.elite, seed=args.seed)
+
+    tune(search, args.generations, args.population, args.games, settings,
+         processes=args.processes, checkpoint=args.checkpoint)
+    print 'weights:', json.dumps(np.round(search.mean, 3).tolist())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import threading
+
+
+class MoveWorker(object):
+    """
+    This object computes the move of an AI player in a background
+    thread, so that the display keeps updating while the AI is thinking.
+    The AI works on a copy of the game, so the game can keep changing
+    (or be thrown away) while the move is being computed.
+
+    methods:
+    done: indicates whether the computation has finished.
+    get: return the move once the computation has finished.
+    cancel: discard the result of the computation.
+    """
+
+    def __init__(self, player, game):
+        """
+        inputs:
+        player: (Player) the AI player whose move should be computed.
+        game: (Game) the current game, which is copied before the thread
+            is started.
+        """
+        self.player = player
+        # a snapshot does not copy the information to undo the moves
+        # made so far, which the AI does not need.
+        self.game = game.snapshot()
+        self.move = None
+        self.error = None
+        self.cancelled = False
+        self.finished = threading.Event()
+
+        self.thread = threading.Thread(target=self.run)
+        # the thread should not keep the application alive when it closes
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            move = self.player.make_move(self.game, None)
+        except Exception as error:
+            self.error = error
+        else:
+            if not self.cancelled:
+                self.move = move
+        self.finished.set()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def get(self):
+        """
+        return the computed move, or raise the error that occurred while
+        computing it.
+        """
+        self.finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.move
+
+    def cancel(self):
+        # a running python thread cannot be stopped, but since it only
+        # works on its own copy of the game, the result can be ignored.
+        self.cancelled = True
+        self.move = None
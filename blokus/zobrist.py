@@ -0,0 +1,73 @@
+import zlib
+
+import numpy as np
+
+from piece import PIECES
+
+
+class ZobristKeys(object):
+    """
+    This object holds the random 64 bit keys used to hash Blokus
+    positions. The hash of a position is the exclusive or of the keys of
+    every occupied cell (one key per player per cell), the key of the
+    player to move, and the keys of the pieces that have been placed.
+    Since exclusive or is its own inverse, the hash can be updated
+    incrementally as pieces are placed and removed.
+    """
+
+    def __init__(self, dimension=20, num_players=4, seed=20151009):
+        random = np.random.RandomState(seed)
+
+        def draw(*size):
+            high = random.randint(0, 2 ** 32, size=size).astype(object)
+            low = random.randint(0, 2 ** 32, size=size).astype(object)
+            return (high * 2 ** 32 + low).tolist()
+
+        self.cells = draw(num_players, dimension, dimension)
+        self.turn = draw(num_players)
+        self.pieces = [dict(zip(sorted(PIECES.keys()), keys))
+                       for keys in draw(num_players, len(PIECES))]
+
+    def placement(self, playerID, pieceID, cells):
+        """
+        the change in the hash when playerID places pieceID on the
+        given (i, j) board cells.
+        """
+        key = self.pieces[playerID][pieceID]
+        keys = self.cells[playerID]
+        for i, j in cells:
+            key ^= keys[i][j]
+        return key
+
+
+_KEYS = {}
+
+
+def get_keys(dimension, num_players):
+    """
+    the ZobristKeys for a board size and number of players, which
+    are shared by every game with the same settings.
+    """
+    key = (dimension, num_players)
+    if key not in _KEYS:
+        _KEYS[key] = ZobristKeys(dimension=dimension, num_players=num_players)
+    return _KEYS[key]
+
+
+_START_KEYS = {}
+
+
+def start_key(start_points):
+    """
+    a 64 bit key for the start points of a game, which is included in the
+    hash of every position so that the same pieces on the same cells in
+    games with different start points have different hashes.
+    """
+    start_points = tuple(tuple(int(x) for x in point)
+                         for point in start_points)
+    if start_points not in _START_KEYS:
+        seed = zlib.crc32(repr(start_points)) & 0xffffffff
+        random = np.random.RandomState(seed)
+        high, low = random.randint(0, 2 ** 32, size=2).astype(object)
+        _START_KEYS[start_points] = int(high * 2 ** 32 + low)
+    return _START_KEYS[start_points]